@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the hot paths of workday on generated days files.
+
+    python benchmarks/benchmark.py --save        store a baseline
+    python benchmarks/benchmark.py               compare against the baseline
+
+Exits with 1 if any benchmark is slower than the baseline by more than the
+threshold.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pyyamlconfig import write_config
+from workday import Workday, BinaryDaysFile, TextDaysFile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'workday', 'workday.py')
+
+
+def generate_days(count: int, start=datetime(1990, 1, 1), seed=0):
+    """
+    Yield count realistic days from start: weekdays only, with vacations and
+    sick days as gaps, and start, lunch and end times that vary a bit.
+    """
+    generator = random.Random(seed)
+    date = start
+    while count > 0:
+        if date.weekday() < 5 and generator.random() > 0.05:
+            start_day = date + timedelta(hours=8, minutes=generator.randint(-45, 45))
+            start_lunch = date + timedelta(hours=11, minutes=generator.randint(15, 75))
+            end_lunch = start_lunch + timedelta(minutes=generator.randint(20, 60))
+            end_day = start_day + timedelta(hours=8, minutes=generator.randint(30, 90))
+            times = (start_day, start_lunch, end_lunch, end_day)
+            yield tuple(int(time.timestamp()) for time in times)
+            count -= 1
+        if generator.random() < 0.004:
+            date += timedelta(weeks=generator.randint(1, 4))
+        date += timedelta(days=1)
+
+
+def remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def best_of(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def benchmark(directory: str, count: int, binary: bool, repeat: int) -> dict:
+    days_file = os.path.join(directory, f'days-{count}.log')
+    days_format = BinaryDaysFile if binary else TextDaysFile
+    days_format(days_file).write(generate_days(count))
+    configfile = os.path.join(directory, f'workday-{count}.yaml')
+    now = int(datetime.now().timestamp())
+    write_config(configfile, {
+        'days_file': days_file,
+        'start_day': now - 4 * 3600,
+        'start_lunch': now - 2 * 3600,
+        'end_lunch': now - 3600,
+        'end_day': 0,
+    })
+
+    def load():
+        Workday(configfile=configfile).load()
+
+    def load_incremental():
+        Workday(configfile=configfile).load_incremental()
+
+    def load_incremental_cold():
+        remove(f'{days_file}.checkpoint')
+        load_incremental()
+
+    loaded = Workday(configfile=configfile)
+    loaded.load()
+    results = {
+        'load': best_of(load, repeat),
+        'load_incremental_cold': best_of(load_incremental_cold, repeat),
+        'load_incremental': best_of(load_incremental, repeat),
+        'tmux_status': best_of(loaded.tmux_status, repeat),
+        'workday_status': best_of(loaded.workday_status, repeat),
+    }
+
+    def cli(*arguments):
+        subprocess.run(
+            [sys.executable, SCRIPT, '--config', configfile, *arguments],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    def cli_tmux_cold():
+        remove(f'{configfile}.tmux')
+        cli('--tmux')
+
+    results['cli_tmux'] = best_of(cli_tmux_cold, repeat)
+    results['cli_tmux_cached'] = best_of(lambda: cli('--tmux'), repeat)
+    results['cli_weeks'] = best_of(lambda: cli('--weeks'), repeat)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Descriptions of the results slower than baseline by more than threshold"""
+    regressions = []
+    for size, timings in results.items():
+        for name, seconds in timings.items():
+            before = baseline.get(size, {}).get(name)
+            if before is not None and seconds > before * (1 + threshold):
+                regressions.append(
+                    f'{size} {name}: {seconds * 1000:.2f} ms, baseline {before * 1000:.2f} ms'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--sizes',
+        help='number of days in the generated days files',
+        type=int,
+        nargs='+',
+        default=[1000, 10000, 100000],
+    )
+    parser.add_argument('--binary', help='generate binary days files', action='store_true')
+    parser.add_argument(
+        '--repeat',
+        help='runs of each benchmark, the best is kept',
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        '--baseline',
+        help='baseline results file',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark.json'),
+    )
+    parser.add_argument('--save', help='store the results as the new baseline', action='store_true')
+    parser.add_argument(
+        '--threshold',
+        help='allowed slowdown against the baseline, 0.25 for 25%%',
+        type=float,
+        default=0.25,
+    )
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.sizes:
+            key = f'{count}-binary' if args.binary else str(count)
+            results[key] = benchmark(directory, count, args.binary, args.repeat)
+            for name, seconds in results[key].items():
+                print(f'{key:>14} {name:<22} {seconds * 1000:10.2f} ms')
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        return 0
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f'No baseline in {args.baseline}, store one with --save')
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f'Regression: {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
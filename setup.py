@@ -21,10 +21,15 @@ setup(
     install_requires=[
         'pyyamlconfig',
     ],
+    extras_require={
+        'stats': ['numpy'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
         'Programming Language :: Python :: 3.7',
     ],
-    scripts=['workday/workday.py'],
+    entry_points={
+        'console_scripts': ['workday = workday.workday:main'],
+    },
 )
@@ -1,7 +1,46 @@
+import csv
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
 import unittest
-from workday import Workday, Day, time_format, time_format_absolute, timestamp_from_string
+from workday import (
+    DaemonServer,
+    Statistics,
+    Workday,
+    Day,
+    DayLog,
+    Calendar,
+    BinaryDaysFile,
+    SqliteDaysFile,
+    StateFile,
+    TextDaysFile,
+    convert_days_file,
+    export,
+    fast_main,
+    main,
+    open_days_file,
+    query_daemon,
+    read_simple_config,
+    team_report,
+    tmux,
+    watch,
+    time_format,
+    time_format_absolute,
+    timestamp_from_string,
+)
 from datetime import datetime, timedelta
+from itertools import islice
+from unittest import mock
 from freezegun import freeze_time
+from pyyamlconfig import load_config, write_config
+from workday.workday import EXPORT_FIELDS, Profiler
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class DataFiles:
@@ -33,6 +72,11 @@ class TestWorkday(unittest.TestCase):
         self.workday.set_config('start_lunch', timestamp_from_string('11:00'))
         self.workday.set_config('end_lunch', timestamp_from_string('12:00'))
 
+    def tearDown(self):
+        for cache in ('tests/config.yaml.tmux', 'tests/days.log.checkpoint', 'tests/days.log.archive'):
+            if os.path.exists(cache):
+                os.remove(cache)
+
     def test_sum(self):
         """Test that summary times are reasonable"""
         self.files.add_log(
@@ -159,6 +203,662 @@ Zero flex at: 17:40
 Full workday at: 17:00''',
         )
 
+    def test_incremental_load(self):
+        """Test that incremental loads match a full load and pick up appended days"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 20, 8, 0),
+            start_lunch=datetime(2018, 8, 20, 11, 0),
+            end_lunch=datetime(2018, 8, 20, 12, 0),
+            end_day=datetime(2018, 8, 20, 17, 0),
+        )
+        self.workday.load_incremental()
+        self.assertEqual(self.workday.until_today, timedelta(hours=8))
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 30),
+        )
+        incremental = Workday(configfile='tests/config.yaml')
+        incremental.load_incremental()
+        full = Workday(configfile='tests/config.yaml')
+        full.load()
+        self.assertEqual(incremental.until_today, full.until_today)
+        self.assertEqual(incremental.until_today_days, 2)
+        self.assertEqual(incremental.total_time, timedelta(hours=20))
+        self.assertEqual(incremental.tmux_status(), full.tmux_status())
+
+        with mock.patch('workday.workday.Workday.write_checkpoint', side_effect=IsADirectoryError):
+            os.remove('tests/days.log.checkpoint')
+            unwritable = Workday(configfile='tests/config.yaml')
+            unwritable.load_incremental()
+        self.assertEqual(unwritable.until_today, full.until_today)
+
+    def test_incremental_load_rewritten(self):
+        """Test that the checkpoint is rebuilt when the days file is rewritten"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 20, 8, 0),
+            start_lunch=datetime(2018, 8, 20, 11, 0),
+            end_lunch=datetime(2018, 8, 20, 12, 0),
+            end_day=datetime(2018, 8, 20, 17, 0),
+        )
+        self.workday.load_incremental()
+        self.files = DataFiles()
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 12, 30),
+        )
+        workday = Workday(configfile='tests/config.yaml')
+        workday.load_incremental()
+        self.assertEqual(workday.until_today, timedelta(hours=3, minutes=30))
+        self.assertEqual(workday.until_today_days, 1)
+
+    def test_incremental_load_week(self):
+        """Test that the current week is read from the end of the days file"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 17, 8, 0),
+            start_lunch=datetime(2018, 8, 17, 11, 0),
+            end_lunch=datetime(2018, 8, 17, 12, 0),
+            end_day=datetime(2018, 8, 17, 16, 30),
+        )
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 50),
+        )
+        workday = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        workday.load_incremental()
+        self.assertEqual(len(workday.week_days), 1)
+        self.assertEqual(
+            workday.week_total(),
+            timedelta(hours=12, minutes=20),
+        )
+        self.assertEqual(workday.until_today_days, 2)
+
+    def test_malformed_lines(self):
+        """Test that malformed lines are skipped and reported by line number"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 20, 8, 0),
+            start_lunch=datetime(2018, 8, 20, 11, 0),
+            end_lunch=datetime(2018, 8, 20, 12, 0),
+            end_day=datetime(2018, 8, 20, 17, 0),
+        )
+        with open('tests/days.log', 'a') as file:
+            file.write('1534917600 1534928400\n\nnot a day\n')
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 0),
+        )
+        with mock.patch('sys.stderr') as stderr:
+            self.workday.load()
+        stderr.write.assert_called_once_with('Skipped malformed lines 2, 4 of tests/days.log\n')
+        self.assertEqual(self.workday.until_today_days, 2)
+        self.assertEqual(self.workday.flex(), timedelta(hours=-1))
+
+        incremental = Workday(configfile='tests/config.yaml')
+        with mock.patch('sys.stderr') as stderr:
+            incremental.load_incremental()
+        self.assertEqual(incremental.flex(), self.workday.flex())
+        with open('tests/days.log', 'a') as file:
+            file.write('1534917600 x 1534932000 1534946400\n')
+        with mock.patch('sys.stderr') as stderr:
+            Workday(configfile='tests/config.yaml').load_incremental()
+        stderr.write.assert_called_once_with('Skipped malformed lines 6 of tests/days.log\n')
+
+        # Rewriting the days file would drop them
+        with open('tests/days.log') as file:
+            raw = file.read()
+        with self.assertRaisesRegex(ValueError, 'Malformed lines 2, 4, 6 of tests/days.log'):
+            Workday(configfile='tests/config.yaml', current_week=(2018, 35)).compact(weeks=0)
+        with self.assertRaises(ValueError):
+            convert_days_file('tests/days.log', 'tests/days.log', binary=True)
+        with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+            main(['--config', 'tests/config.yaml', '--convert', 'sqlite'])
+        with tempfile.TemporaryDirectory() as directory:
+            export_file = os.path.join(directory, 'punches.csv')
+            with open(export_file, 'w') as file:
+                file.write('2018-08-13 08:00\n2018-08-13 16:00\n')
+            with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+                main(['--config', 'tests/config.yaml', '--import', export_file])
+        with open('tests/days.log') as file:
+            self.assertEqual(file.read(), raw)
+
+    def test_binary_days_file(self):
+        """Test that a binary days file loads the same as a text one"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 17, 8, 0),
+            start_lunch=datetime(2018, 8, 17, 11, 0),
+            end_lunch=datetime(2018, 8, 17, 12, 0),
+            end_day=datetime(2018, 8, 17, 16, 30),
+        )
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 50),
+        )
+        text = Workday(configfile='tests/config.yaml')
+        text.load()
+        convert_days_file('tests/days.log', 'tests/days.log', binary=True)
+        days = open_days_file('tests/days.log')
+        self.assertIsInstance(days, BinaryDaysFile)
+        self.assertEqual(len(days), 2)
+        self.assertEqual(days.record(1)[0], int(datetime(2018, 8, 21, 8, 0).timestamp()))
+        self.workday.log_day()
+        self.assertEqual(len(days), 3)
+        self.assertEqual(list(days.reversed_records())[0], self.workday.current_day().to_record())
+
+        binary = Workday(configfile='tests/config.yaml')
+        binary.load()
+        self.assertEqual(binary.until_today_days, 3)
+        self.assertEqual(binary.all_days[1].to_record(), text.all_days[1].to_record())
+        incremental = Workday(configfile='tests/config.yaml')
+        incremental.load_incremental()
+        self.assertEqual(incremental.until_today, binary.until_today)
+
+        convert_days_file('tests/days.log', 'tests/days.log', binary=False)
+        self.assertIsInstance(open_days_file('tests/days.log'), TextDaysFile)
+        with open('tests/days.log') as file:
+            self.assertEqual(file.readlines()[-1], self.workday.current_day().to_line())
+
+    def test_sqlite_days_file(self):
+        """Test that an SQLite days file loads the same as a text one"""
+        for day in (17, 20, 21):
+            self.files.add_log(
+                start_day=datetime(2018, 8, day, 8, 0),
+                start_lunch=datetime(2018, 8, day, 11, 0),
+                end_lunch=datetime(2018, 8, day, 12, 0),
+                end_day=datetime(2018, 8, day, 15 + day % 3, 0),
+            )
+        text = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        text.load()
+        convert_days_file('tests/days.log', 'tests/days.log', days_format='sqlite')
+        days = open_days_file('tests/days.log')
+        self.assertIsInstance(days, SqliteDaysFile)
+        self.assertEqual(list(days.records()), list(islice(text.all_days.records(), 3)))
+
+        workday = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        workday.load()
+        self.assertEqual(workday.workday_status(), text.workday_status())
+        incremental = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        incremental.load_incremental()
+        self.assertEqual(incremental.flex(), text.flex())
+        self.assertEqual(incremental.tmux_status(), text.tmux_status())
+        self.assertEqual(len(incremental.week_days), 2)
+
+        self.workday.set_config('end_day', timestamp_from_string('17:00'))
+        self.workday.log_day()
+        self.assertEqual(days.totals(), (int(text.until_today.total_seconds()) + 8 * 3600, 4))
+        self.assertEqual(days.week_records(2018, 34)[-1], self.workday.current_day().to_record())
+        self.assertEqual(next(days.reversed_records()), self.workday.current_day().to_record())
+
+    def test_export(self):
+        """Test that days and week totals are exported in every format"""
+        for day, hours in ((10, 9), (13, 7), (14, 8), (21, 8)):
+            self.files.add_log(
+                start_day=datetime(2018, 8, day, 8, 0),
+                start_lunch=datetime(2018, 8, day, 11, 0),
+                end_lunch=datetime(2018, 8, day, 11, 30),
+                end_day=datetime(2018, 8, day, 8, 30) + timedelta(hours=hours),
+            )
+        days = open_days_file('tests/days.log')
+        out = io.StringIO()
+        export(days, out, 'ndjson', start=datetime(2018, 8, 11), end=datetime(2018, 8, 20), rows_per_write=2)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['day', 'day', 'week'])
+        self.assertEqual(rows[0]['start_day'], int(datetime(2018, 8, 13, 8, 0).timestamp()))
+        self.assertEqual(rows[0]['worked'], 7 * 3600)
+        self.assertEqual(rows[0]['lunch'], 1800)
+        self.assertEqual(
+            rows[2],
+            {'type': 'week', 'iso_year': 2018, 'iso_week': 33, 'worked': 15 * 3600, 'days': 2, 'flex': -3600},
+        )
+
+        array = io.StringIO()
+        export(days, array, 'json')
+        lines = io.StringIO()
+        export(days, lines, 'ndjson')
+        self.assertEqual(json.loads(array.getvalue()), [json.loads(line) for line in lines.getvalue().splitlines()])
+        self.assertEqual(len(json.loads(array.getvalue())), 7)
+        out = io.StringIO()
+        export(days, out, 'csv', start=datetime(2018, 9, 1))
+        self.assertEqual(out.getvalue(), ','.join(EXPORT_FIELDS) + '\n')
+        out = io.StringIO()
+        export(days, out, 'csv')
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual([row['flex'] for row in rows if row['type'] == 'week'], ['3600', '-3600', '0'])
+
+    def test_import_punches(self):
+        """Test that punches are paired into days and added once, sorted"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 14, 8, 0),
+            start_lunch=datetime(2018, 8, 14, 11, 0),
+            end_lunch=datetime(2018, 8, 14, 12, 0),
+            end_day=datetime(2018, 8, 14, 17, 0),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            export_file = os.path.join(directory, 'punches.tsv')
+            with open(export_file, 'w') as file:
+                file.write('Employee\tDate\tTime\n')
+                for punch in (
+                        '2018-08-13 08:00', '2018-08-13 11:30', '2018-08-13 12:00', '2018-08-13 17:00',
+                        '2018-08-13 17:00', '2018-08-14 08:00', '2018-08-14 16:00',
+                        '2018-08-20 07:00', '2018-08-20 10:00', '2018-08-20 10:30', '2018-08-20 12:00',
+                        '2018-08-20 12:30', '2018-08-20 15:30', '2018-08-21 08:00',
+                ):
+                    file.write('1\t{}\t{}\n'.format(*punch.split()))
+            with mock.patch('workday.workday.IMPORT_CHUNK_LINES', 4):
+                added, skipped, unpaired = self.workday.import_punches(export_file, workers=2)
+            self.assertEqual(self.workday.import_punches(export_file, workers=1)[0], 0)
+        self.assertEqual(added, 2)
+        self.assertEqual([str(date) for date in skipped], ['2018-08-14'])
+        self.assertEqual([str(date) for date in unpaired], ['2018-08-21'])
+        days = list(open_days_file('tests/days.log').records())
+        self.assertEqual([Day(*record).day_time() for record in days], [
+            timedelta(hours=8, minutes=30), timedelta(hours=8), timedelta(hours=7, minutes=30),
+        ])
+        self.assertEqual(days[2][1:3], (
+            int(datetime(2018, 8, 20, 10, 0).timestamp()), int(datetime(2018, 8, 20, 11, 0).timestamp()),
+        ))
+
+        # Days older than a compacted week go before its summary
+        compactor = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        self.assertEqual(compactor.compact(weeks=0), (2, 1))
+        with tempfile.TemporaryDirectory() as directory:
+            export_file = os.path.join(directory, 'punches.csv')
+            with open(export_file, 'w') as file:
+                file.write('2015-06-01 08:00\n2015-06-01 12:00\n2015-06-01 12:30\n2015-06-01 16:30\n')
+            self.assertEqual(compactor.import_punches(export_file)[0], 1)
+        with open('tests/days.log') as file:
+            self.assertEqual(file.readline().split()[0], str(int(datetime(2015, 6, 1, 8, 0).timestamp())))
+        out = io.StringIO()
+        export(open_days_file('tests/days.log'), out, 'csv', datetime(2015, 1, 1), datetime(2015, 12, 31))
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        compactor.load()
+        self.assertEqual(
+            compactor.worked_between(datetime(2018, 1, 1), datetime(2018, 12, 31)),
+            (timedelta(hours=24), 3),
+        )
+
+    def test_batch_config(self):
+        """Test that batched config changes are written once, or not at all"""
+        with mock.patch('workday.workday.write_config', wraps=write_config) as write:
+            self.workday.reset()
+            self.assertEqual(write.call_count, 1)
+        self.assertEqual(Workday(configfile='tests/config.yaml').config['start_day'], 0)
+
+        with self.assertRaises(ValueError):
+            with self.workday.batch_config():
+                self.workday.set_config('start_day', 1)
+                raise ValueError()
+        self.assertEqual(self.workday.config['start_day'], 0)
+
+        with self.workday.batch_config():
+            self.workday.set_config('start_day', 1)
+            self.assertEqual(Workday(configfile='tests/config.yaml').config['start_day'], 0)
+        self.assertEqual(Workday(configfile='tests/config.yaml').config['start_day'], 1)
+
+    def test_daemon(self):
+        """Test that the daemon answers like the in-process computation"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 50),
+        )
+        self.workday = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        self.workday.load()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'workday.sock')
+            self.assertIsNone(query_daemon('tmux', 'tests/config.yaml', path))
+            with DaemonServer('tests/config.yaml', path) as server:
+                thread = threading.Thread(target=server.serve_forever)
+                thread.start()
+                try:
+                    self.assertEqual(
+                        query_daemon('tmux', 'tests/config.yaml', path),
+                        self.workday.tmux_status(),
+                    )
+                    self.assertEqual(
+                        query_daemon('weeks', 'tests/config.yaml', path),
+                        self.workday.workday_status(),
+                    )
+                    self.workday.set_config('end_day', timestamp_from_string('13:00'))
+                    self.assertIn('04:00', query_daemon('tmux', 'tests/config.yaml', path))
+                    self.assertIsNone(query_daemon('tmux', 'tests/other.yaml', path))
+                    with mock.patch('os.getuid', return_value=os.getuid() + 1):
+                        self.assertIsNone(query_daemon('tmux', 'tests/config.yaml', path))
+                finally:
+                    server.shutdown()
+                    thread.join()
+            self.assertFalse(os.path.exists(path))
+
+        # Like on windows, where there are no user ids
+        self.addCleanup(setattr, os, 'getuid', os.getuid)
+        del os.getuid
+        self.assertIsNone(query_daemon('tmux', 'tests/config.yaml'))
+        self.assertIn('04:00', tmux('tests/config.yaml'))
+        with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+            main(['--config', 'tests/config.yaml', '--daemon'])
+
+    def test_watch(self):
+        """Test that the watched status is printed again when the data changes"""
+        for inotify in (True, False):
+            self.workday.set_config('end_day', 0)
+            read, write = os.pipe()
+            with os.fdopen(read) as lines, os.fdopen(write, 'w') as out, \
+                    mock.patch('workday.workday.FileWatcher.poll_interval', 0.05):
+                thread = threading.Thread(target=watch, args=('tests/config.yaml', out, 2, inotify))
+                thread.start()
+                try:
+                    self.assertEqual(lines.readline(), self.workday.tmux_status() + '\n')
+                    self.workday.set_config('end_day', timestamp_from_string('13:00'))
+                    self.assertEqual(lines.readline(), self.workday.tmux_status() + '\n')
+                finally:
+                    thread.join()
+
+    def test_fast_main(self):
+        """Test that hot commands are handled without the argument parser"""
+        with mock.patch('builtins.print') as output:
+            self.assertTrue(fast_main(['--config', 'tests/config.yaml', '--tmux']))
+        self.assertEqual(output.call_args[0][0], self.workday.tmux_status())
+        self.workday.reset()
+        self.assertTrue(fast_main(['--start-empty-day', '-c', 'tests/config.yaml']))
+        self.assertEqual(
+            Workday(configfile='tests/config.yaml').config['start_day'],
+            int(datetime.now().timestamp()),
+        )
+        self.assertFalse(fast_main(['--tmux', '--weeks']))
+        self.assertFalse(fast_main(['--start-empty-day', '08:00']))
+        self.assertFalse(fast_main(['--config']))
+
+    def test_profile(self):
+        """Test that the phases of a run are profiled"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'profile.jsonl')
+            dump = os.path.join(directory, 'profile.prof')
+            with mock.patch('workday.workday.PROFILER', Profiler()), mock.patch('sys.stdout'):
+                main(['--profile', output, '--config', 'tests/config.yaml', '--weeks'])
+                main(['--config', 'tests/config.yaml', '--tmux', '--profile-dump', dump])
+            with open(output) as file:
+                lines = [json.loads(line) for line in file]
+            self.assertTrue(os.path.exists(dump))
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['argv'], ['--config', 'tests/config.yaml', '--weeks'])
+        self.assertEqual(
+            [phase['phase'] for phase in lines[0]['phases']],
+            ['import', 'config', 'parse', 'aggregate', 'format'],
+        )
+        profiler = Profiler()
+        self.assertEqual(profiler.configure(['--tmux'], {'WORKDAY_PROFILE': '1'}), ['--tmux'])
+        self.assertEqual(profiler.output, '1')
+        self.assertEqual(profiler.configure(['--profile', '--tmux'], {}), ['--tmux'])
+        self.assertEqual(profiler.output, '-')
+        for environment in ({}, {'WORKDAY_PROFILE': '0'}, {'WORKDAY_PROFILE': '', 'WORKDAY_PROFILE_DUMP': '0'}):
+            profiler = Profiler()
+            profiler.configure(['--weeks'], environment)
+            self.assertFalse(profiler.enabled)
+
+    def test_actions_in_order(self):
+        """Test that several actions run in order with one config write"""
+        self.workday.set_config('end_day', 0)
+        with mock.patch('workday.workday.write_config', wraps=write_config) as write, \
+                mock.patch('sys.stdout'):
+            main(['--config', 'tests/config.yaml', '--end-day', '17:00', '--log-day', '--reset', '--weeks'])
+        self.assertEqual(write.call_count, 1)
+        workday = Workday(configfile='tests/config.yaml')
+        self.assertEqual(workday.current_record(), (0, 0, 0, 0))
+        workday.load()
+        self.assertEqual(workday.all_days[0].day_time(), timedelta(hours=8))
+
+        stdin = ['start-day 08:00\n', '# lunch\n', '--lunch 11:00 11:30\n', 'end-day 16:00\n']
+        with mock.patch('workday.workday.write_config', wraps=write_config) as write, \
+                mock.patch('sys.stdin', stdin):
+            main(['--config', 'tests/config.yaml', '--batch'])
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(
+            Workday(configfile='tests/config.yaml').current_day().day_time(),
+            timedelta(hours=7, minutes=30),
+        )
+
+        with mock.patch('sys.stdin', []):
+            main(['--config', 'tests/config.yaml', '--log-day', '--batch'])
+        with open('tests/days.log') as file:
+            self.assertEqual(len(file.readlines()), 2)
+
+        with mock.patch('builtins.print') as output:
+            main(['--config', 'tests/config.yaml', '--end-day', '17:00', '--log-day', '--reset', '--tmux'])
+        workday = Workday(configfile='tests/config.yaml')
+        self.assertEqual(workday.current_record(), (0, 0, 0, 0))
+        workday.load_incremental()
+        self.assertEqual(output.call_args[0][0], workday.tmux_status())
+        self.assertEqual(workday.until_today_days, 3)
+        for argv in (['--tmux', '--daemon'], ['--watch', '--daemon'], ['--reset', '--team', '*.yaml']):
+            with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+                main(['--config', 'tests/config.yaml', *argv])
+
+    def test_snapshot(self):
+        """Test that a snapshot evaluates the status once, at one moment"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 18, 0),
+        )
+        workday = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        workday.load()
+        snapshot = workday.snapshot(now=datetime(2018, 8, 22, 14, 0))
+        self.assertEqual(snapshot.day_time(), timedelta(hours=5))
+        self.assertEqual(snapshot.week_total(), timedelta(hours=14))
+        self.assertEqual(snapshot.when_leave(), datetime(2018, 8, 22, 16, 0))
+        self.assertEqual(snapshot.full_workday(), datetime(2018, 8, 22, 17, 0))
+
+        with mock.patch('workday.workday.Day.day_time', autospec=True, side_effect=Day.day_time) as day_time, \
+                mock.patch('workday.workday.datetime', wraps=datetime) as now:
+            workday.tmux_status()
+        self.assertEqual(day_time.call_count, 2)
+        self.assertEqual(now.now.call_count, 1)
+
+    def test_calendar(self):
+        """Test that flex and the time left of the day follow the calendar"""
+        for day, end in ((20, 17), (21, 15)):
+            self.files.add_log(
+                start_day=datetime(2018, 8, day, 8, 0),
+                start_lunch=datetime(2018, 8, day, 11, 0),
+                end_lunch=datetime(2018, 8, day, 12, 0),
+                end_day=datetime(2018, 8, day, end, 0),
+            )
+        self.addCleanup(self.workday.save_config)
+        self.addCleanup(self.workday.config.pop, 'calendar_file', None)
+        with tempfile.TemporaryDirectory() as directory:
+            calendar_file = os.path.join(directory, 'calendar')
+            with open(calendar_file, 'w') as file:
+                file.write('# Short Tuesdays\ntuesday 6\n2018-08-20 7:30\nwednesday 6.5\n')
+            self.workday.set_config('calendar_file', calendar_file)
+            calendar = Calendar.from_file(calendar_file)
+            self.assertIsNone(calendar.uniform)
+            self.assertEqual(calendar.week_target(2018, 34), 8 * 3600 * 4 + 20 * 3600)
+
+            workday = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+            workday.load()
+            self.assertEqual(workday.flex(), timedelta(minutes=30))
+            monday = datetime(2018, 8, 20)
+            self.assertEqual(workday.flex_between(monday, monday), timedelta(minutes=30))
+            snapshot = workday.snapshot()
+            self.assertEqual(snapshot.until_workday_done(), timedelta(hours=2))
+            self.assertEqual(snapshot.when_leave(), datetime(2018, 8, 22, 15, 0))
+            self.assertIn('Total: 18:30 (-01:30)\n', workday.workday_status())
+
+            incremental = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+            incremental.load_incremental()
+            self.assertEqual(incremental.flex(), timedelta(minutes=30))
+            with open(calendar_file, 'a') as file:
+                file.write('2018-08-21 5\n')
+            incremental = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+            incremental.load_incremental()
+            self.assertEqual(incremental.flex(), timedelta(hours=1, minutes=30))
+
+            out = io.StringIO()
+            export(open_days_file('tests/days.log'), out, 'ndjson', calendar=incremental.calendar)
+            self.assertEqual(json.loads(out.getvalue().splitlines()[-1])['flex'], 5400)
+            if numpy is not None:
+                statistics = Statistics.from_file('tests/days.log', incremental.calendar)
+                self.assertEqual(statistics.flex.tolist(), [1800, 5400])
+
+            with open(calendar_file, 'w') as file:
+                file.write('friday six\n')
+            with self.assertRaises(ValueError):
+                Calendar.from_file(calendar_file)
+
+    def test_render_cache(self):
+        """Test that the tmux status is rendered once a minute or on changes"""
+        status = tmux('tests/config.yaml')
+        self.assertEqual(status, self.workday.tmux_status())
+        with mock.patch('workday.workday.Workday.load_incremental', side_effect=AssertionError):
+            self.assertEqual(tmux('tests/config.yaml'), status)
+        self.workday.set_config('end_day', timestamp_from_string('13:00'))
+        self.assertNotEqual(tmux('tests/config.yaml'), status)
+        with freeze_time("2018-08-22 13:31"):
+            with mock.patch('workday.workday.Workday.load_incremental', side_effect=AssertionError):
+                with self.assertRaises(AssertionError):
+                    tmux('tests/config.yaml')
+        with mock.patch('workday.workday.write_render_cache', side_effect=PermissionError):
+            os.remove('tests/config.yaml.tmux')
+            self.assertEqual(tmux('tests/config.yaml'), self.workday.tmux_status())
+
+    def test_workday_status_range(self):
+        """Test that a range of weeks keeps the flex of the weeks before it"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 17, 8, 0),
+            start_lunch=datetime(2018, 8, 17, 11, 0),
+            end_lunch=datetime(2018, 8, 17, 12, 0),
+            end_day=datetime(2018, 8, 17, 16, 30),
+        )
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 50),
+        )
+        self.workday.load()
+        status = self.workday.workday_status()
+        for since, last in (((2018, 34), None), (None, 1), ((2018, 1), 1)):
+            workday = Workday(configfile='tests/config.yaml')
+            workday.load_weeks(since=since, last=last)
+            self.assertEqual(workday.workday_status(), status[status.index('34\n'):])
+        workday = Workday(configfile='tests/config.yaml')
+        workday.load_weeks(last=2)
+        self.assertEqual(''.join(workday.iter_workday_status()), status)
+
+    def test_compact(self):
+        """Test that compacted weeks keep their totals and flex"""
+        for day, hours in ((30, 9), (31, 7), (6, 8), (7, 10), (14, 6), (21, 8)):
+            date = datetime(2018, 8, day) if day < 30 else datetime(2018, 7, day)
+            self.files.add_log(
+                start_day=date.replace(hour=8),
+                start_lunch=date.replace(hour=11),
+                end_lunch=date.replace(hour=12),
+                end_day=date.replace(hour=9 + hours),
+            )
+        self.workday.load()
+        status = self.workday.workday_status()
+        with open('tests/days.log') as file:
+            raw = file.read()
+        compactor = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        self.assertEqual(compactor.compact(weeks=1), (4, 2))
+        self.assertEqual(compactor.compact(weeks=1), (0, 0))
+        with open('tests/days.log.archive') as file:
+            self.assertEqual(file.read(), ''.join(raw.splitlines(True)[:4]))
+        os.remove('tests/days.log.archive')
+        with open('tests/days.log') as file:
+            self.assertEqual(file.readline(), '-1 201831 57600 2\n')
+
+        workday = Workday(configfile='tests/config.yaml')
+        workday.load()
+        self.assertEqual(workday.flex(), self.workday.flex())
+        self.assertEqual(workday.until_today_days, 6)
+        compacted = workday.workday_status()
+        self.assertIn('31\n  2 days 16:00\n  -----\n  Total: 16:00 (00:00)\n', compacted)
+        self.assertEqual(compacted[compacted.index('33\n'):], status[status.index('33\n'):])
+        self.assertEqual(workday.flex_between(datetime(2018, 7, 30), datetime(2018, 8, 10)), timedelta(hours=2))
+        incremental = Workday(configfile='tests/config.yaml')
+        incremental.load_incremental()
+        self.assertEqual(incremental.flex(), self.workday.flex())
+        weeks = Workday(configfile='tests/config.yaml')
+        weeks.load_weeks(last=2)
+        self.assertEqual(weeks.workday_status(), status[status.index('33\n'):])
+
+        convert_days_file('tests/days.log', 'tests/days.log', binary=True)
+        self.assertEqual(compactor.compact(weeks=0), (1, 1))
+        workday = Workday(configfile='tests/config.yaml')
+        workday.load()
+        self.assertEqual(workday.flex(), self.workday.flex())
+        self.assertEqual(len(workday.all_days), 5)
+        if numpy is not None:
+            self.assertEqual(Statistics.from_file('tests/days.log').weeks[1].tolist(), [57600, 64800, 21600, 28800])
+
+    def test_flex_between(self):
+        """Test totals over date ranges and that weeks are told apart by year"""
+        self.files.add_log(
+            start_day=datetime(2017, 8, 24, 8, 0),
+            start_lunch=datetime(2017, 8, 24, 11, 0),
+            end_lunch=datetime(2017, 8, 24, 12, 0),
+            end_day=datetime(2017, 8, 24, 17, 0),
+        )
+        self.files.add_log(
+            start_day=datetime(2018, 8, 17, 8, 0),
+            start_lunch=datetime(2018, 8, 17, 11, 0),
+            end_lunch=datetime(2018, 8, 17, 12, 0),
+            end_day=datetime(2018, 8, 17, 16, 30),
+        )
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 50),
+        )
+        workday = Workday(configfile='tests/config.yaml', current_week=(2018, 34))
+        workday.load()
+        self.assertEqual(len(workday.week_days), 1)
+        self.assertEqual(workday.all_days.week_range(2017, 34), (0, 1))
+        self.assertEqual(workday.all_days.week_range(2018, 34), (2, 4))
+        self.assertEqual(
+            workday.flex_between(datetime(2018, 8, 1), datetime(2018, 8, 21)),
+            timedelta(minutes=-40),
+        )
+        self.assertEqual(
+            workday.worked_between(datetime(2017, 1, 1), datetime(2018, 8, 17)),
+            (timedelta(hours=15, minutes=30), 2),
+        )
+        self.assertEqual(workday.flex_between(workday.all_days[0].start_day, datetime(2017, 8, 24)), timedelta())
+        self.assertEqual(workday.flex_between(datetime(2018, 8, 22), datetime(2018, 8, 31)), timedelta())
+
+    def test_team_report(self):
+        """Test that a team report has a row per config file"""
+        self.files.add_log(
+            start_day=datetime(2018, 8, 21, 8, 0),
+            start_lunch=datetime(2018, 8, 21, 11, 0),
+            end_lunch=datetime(2018, 8, 21, 12, 0),
+            end_day=datetime(2018, 8, 21, 16, 50),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('alice', 'bob'):
+                write_config(os.path.join(directory, f'{name}.yaml'), self.workday.config)
+            write_config(os.path.join(directory, 'carol.yaml'), {'days_file': directory})
+            with mock.patch('workday.workday.Workday.write_checkpoint', side_effect=AssertionError):
+                report = team_report([directory], workers=1)
+            self.assertEqual(report, team_report([os.path.join(directory, '*.yaml')]))
+        lines = report.split('\n')
+        self.assertEqual(lines[0].split(), ['Name', 'Flex', 'Week', 'Zero', 'flex'])
+        self.assertEqual(lines[1].split(), ['alice', '-00:10', '04:30', '17:10'])
+        self.assertEqual(lines[1].split(), lines[2].replace('bob', 'alice').split())
+        self.assertTrue(lines[3].startswith('carol  error'))
+
     def test_log(self):
         """Test that a day is logged"""
         self.workday.log_day()
@@ -185,6 +885,108 @@ Full workday at: 17:00''',
                 last = None
         self.assertIsNone(last)
 
+@unittest.skipIf(numpy is None, 'needs numpy')
+class TestStatistics(unittest.TestCase):
+    def test_statistics(self):
+        files = DataFiles()
+        files.add_log(
+            start_day=datetime(2017, 12, 29, 8, 0),
+            start_lunch=datetime(2017, 12, 29, 11, 0),
+            end_lunch=datetime(2017, 12, 29, 11, 30),
+            end_day=datetime(2017, 12, 29, 17, 0),
+        )
+        files.add_log(
+            start_day=datetime(2018, 1, 1, 7, 0),
+            start_lunch=datetime(2018, 1, 1, 11, 0),
+            end_lunch=datetime(2018, 1, 1, 12, 0),
+            end_day=datetime(2018, 1, 1, 15, 0),
+        )
+        files.add_log(
+            start_day=datetime(2018, 12, 31, 9, 0),
+            start_lunch=datetime(2018, 12, 31, 11, 0),
+            end_lunch=datetime(2018, 12, 31, 12, 0),
+            end_day=datetime(2018, 12, 31, 17, 0),
+        )
+        statistics = Statistics.from_file('tests/days.log')
+        self.assertEqual(statistics.worked.tolist(), [30600, 25200, 25200])
+        self.assertEqual(statistics.flex.tolist(), [1800, -1800, -5400])
+        self.assertEqual(statistics.start_time.tolist(), [28800, 25200, 32400])
+        self.assertEqual(statistics.iso_week.tolist(), [52, 1, 1])
+        self.assertEqual(statistics.weeks[0].tolist(), [201752, 201801, 201901])
+        self.assertEqual(statistics.years[1].tolist(), [30600, 50400])
+        self.assertEqual(statistics.years[2].tolist(), [1, 2])
+        self.assertIn('Flex: -01:30', statistics.report())
+
+        convert_days_file('tests/days.log', 'tests/days.log', binary=True)
+        self.assertEqual(Statistics.from_file('tests/days.log').worked.tolist(), [30600, 25200, 25200])
+        open('tests/days.log', 'w').close()
+        self.assertEqual(Statistics.from_file('tests/days.log').report(), 'No days logged')
+
+
+class TestConfig(unittest.TestCase):
+    def test_simple_config(self):
+        self.assertEqual(
+            read_simple_config('tests/config.yaml'),
+            load_config('tests/config.yaml'),
+        )
+
+    def test_simple_config_fallback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            configfile = os.path.join(directory, 'config.yaml')
+            for line in ('days_file: ~', 'start_day: 08:00', 'days_file: "a"', 'days:\n  - a'):
+                with open(configfile, 'w') as file:
+                    file.write(line)
+                with self.assertRaises(ValueError):
+                    read_simple_config(configfile)
+                self.assertEqual(Workday(configfile=configfile).config, load_config(configfile))
+
+    def test_replaced_config_keeps_link_and_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            target = os.path.join(directory, 'target.yaml')
+            configfile = os.path.join(directory, 'config.yaml')
+            write_config(target, {'days_file': os.path.join(directory, 'days.log')})
+            os.chmod(target, 0o600)
+            os.symlink(target, configfile)
+            Workday(configfile=configfile).set_config('start_day', 1534917600)
+            self.assertTrue(os.path.islink(configfile))
+            self.assertEqual(os.stat(target).st_mode & 0o777, 0o600)
+            self.assertEqual(load_config(target)['start_day'], 1534917600)
+
+    def test_state_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            configfile = os.path.join(directory, 'config.yaml')
+            state_file = os.path.join(directory, 'state')
+            write_config(configfile, {
+                'days_file': os.path.join(directory, 'days.log'),
+                'state_file': state_file,
+                'start_day': 1534917600,
+            })
+            workday = Workday(configfile=configfile)
+            self.assertEqual(StateFile(state_file).read(), (1534917600, 0, 0, 0))
+            with mock.patch('workday.workday.write_config') as written:
+                workday.set_config('end_day', 1534946400)
+                workday.reset()
+                workday.set_config('start_day', 1535004000)
+            written.assert_not_called()
+            self.assertEqual(Workday(configfile=configfile).current_record(), (1535004000, 0, 0, 0))
+            with open(state_file, 'rb') as file:
+                self.assertEqual(file.read(16)[8:], (6).to_bytes(8, 'little'))
+
+            workday.set_config('name', 'me')
+            config = load_config(configfile)
+            self.assertEqual(config['name'], 'me')
+            self.assertNotIn('start_day', config)
+            self.assertIn(state_file, workday.source_files())
+
+            # A torn read is retried until the writer is done
+            with open(state_file, 'rb+') as file:
+                file.seek(8)
+                file.write((7).to_bytes(8, 'little'))
+            with mock.patch('os.pread', side_effect=os.pread) as pread:
+                StateFile(state_file).read()
+            self.assertGreater(pread.call_count, 2)
+
+
 class TestFormat(unittest.TestCase):
     def test_timedelta(self):
         # Test without tmux
@@ -262,6 +1064,38 @@ class TestDay(unittest.TestCase):
             34,
         )
 
+    def test_day_log(self):
+        days = DayLog([
+            (1534744800, 1534755600, 1534759200, 1534777200),
+            (1534831200, 1534842000, 1534845600, 1534861800),
+        ])
+        self.assertEqual(len(days), 2)
+        self.assertEqual(days.day_seconds(1), 7 * 3600 + 30 * 60)
+        self.assertEqual(days[1].day_time(), timedelta(hours=7, minutes=30))
+        self.assertEqual([day.to_record() for day in days], list(days.records()))
+        with self.assertRaises(AttributeError):
+            days[0].note = 'no __dict__'
+
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_compare(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        path = os.path.join(root, 'benchmarks', 'benchmark.py')
+        spec = importlib.util.spec_from_file_location('benchmark', path)
+        benchmark = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(benchmark)
+        baseline = {'1000': {'load': 0.010, 'tmux_status': 0.002}}
+        results = {
+            '1000': {'load': 0.0126, 'tmux_status': 0.0024, 'cli_tmux': 1.0},
+            '100000': {'load': 10.0},
+        }
+        self.assertEqual(
+            benchmark.compare(results, baseline, 0.25),
+            ['1000 load: 12.60 ms, baseline 10.00 ms'],
+        )
+        self.assertEqual(benchmark.compare(results, baseline, 0.3), [])
+
 
 if __name__ == '__main__':
     unittest.main()
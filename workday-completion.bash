@@ -1,3 +1,3 @@
 #!/usr/bin/env bash
 
-complete -W "-h --config --start-day --start-empty-day --end-day --lunch --log-day -l --reset -r --reset-end --tmux -t --weeks -w --version -v" workday
+complete -W "-h --config --start-day --start-empty-day --end-day --lunch --log-day -l --reset -r --reset-end --tmux -t --weeks -w --since --last --flex-between --stats --export --from --to --batch --import --team --convert --compact --daemon --watch --socket --profile --profile-dump --version -v" workday
@@ -2,8 +2,31 @@ from workday.workday import (
     __version__,
     Workday,
     Day,
+    DayLog,
+    Calendar,
+    Snapshot,
+    Statistics,
+    TextDaysFile,
+    BinaryDaysFile,
+    SqliteDaysFile,
+    StateFile,
+    open_days_file,
+    convert_days_file,
+    DaemonServer,
+    query_daemon,
+    serve,
+    main,
+    fast_main,
+    tmux,
+    watch,
+    team_report,
+    export,
+    read_render_cache,
+    read_config,
+    read_simple_config,
     WORKDAY_HOURS,
     CURRENT_WEEK,
+    CURRENT_ISO_WEEK,
     time_format,
     time_format_absolute,
     timestamp_from_string,
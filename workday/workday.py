@@ -2,15 +2,70 @@
 
 __version__ = '0.1.3'
 
+# Only cheap modules are imported here, as --tmux runs on every status line
+# refresh. The rest are imported where they are used.
+import sys
+from time import monotonic, perf_counter, sleep
+IMPORT_STARTED = (perf_counter(), sys.getallocatedblocks())
+# pylint: disable=wrong-import-position
+from array import array
+from bisect import bisect_left
+from contextlib import closing, contextmanager
 from datetime import datetime, timedelta
-from pathlib import Path
-import argparse
+from itertools import accumulate, chain, islice
+import mmap
+from operator import sub
 import os
-from pyyamlconfig import load_config, write_config
+import struct
+from zlib import crc32
 
 
 WORKDAY_HOURS = 8
 CURRENT_WEEK = datetime.now().isocalendar()[1]
+CURRENT_ISO_WEEK = tuple(datetime.now().isocalendar()[:2])
+BINARY_MAGIC = b'WORKDAY\x01'
+SQLITE_MAGIC = b'SQLite format 3\x00'
+SQLITE_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS days ('
+    'start_day INTEGER NOT NULL, start_lunch INTEGER NOT NULL, '
+    'end_lunch INTEGER NOT NULL, end_day INTEGER NOT NULL, '
+    'week INTEGER NOT NULL, seconds INTEGER NOT NULL, days INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS days_start_day ON days (start_day)',
+    'CREATE INDEX IF NOT EXISTS days_week ON days (week)',
+)
+RECORD = struct.Struct('<4q')
+STATE_MAGIC = b'WORKDAY\x02'
+SEQUENCE = struct.Struct('<Q')
+STATE = struct.Struct('<Q4q')
+STATE_READ_RETRIES = 100
+DAY_KEYS = ('start_day', 'start_lunch', 'end_lunch', 'end_day')
+SUMMARY = -1
+COMPACT_WEEKS = 52
+EXPORT_FORMATS = ('csv', 'json', 'ndjson')
+IMPORT_CHUNK_LINES = 10000
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+EXPORT_FIELDS = (
+    'type', 'iso_year', 'iso_week', 'start_day', 'start_lunch', 'end_lunch', 'end_day',
+    'worked', 'lunch', 'days', 'flex',
+)
+YAML_SPECIAL = {'', '~', 'null', 'true', 'false', 'yes', 'no', 'on', 'off', 'y', 'n'}
+HOT_COMMANDS = {
+    '--tmux': 'tmux',
+    '-t': 'tmux',
+    '--start-empty-day': 'start_empty_day',
+}
+EMPTY_CHECKPOINT = {
+    'offset': 0,
+    'size': 0,
+    'mtime': 0,
+    'inode': 0,
+    'tail': '',
+    'until_today': 0,
+    'until_today_days': 0,
+    'lines': 0,
+    'target': 0,
+    'calendar': '',
+}
 
 
 def time_format(diff: timedelta, threshold=None) -> str:
@@ -64,6 +119,490 @@ def timestamp_from_string(datestring: str) -> int:
     )
 
 
+def reversed_lines(file, block_size=4096):
+    """Yield the non-empty lines of a binary file, starting from the end"""
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    remainder = b''
+    while position > 0:
+        step = min(block_size, position)
+        position -= step
+        file.seek(position)
+        lines = (file.read(step) + remainder).split(b'\n')
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            if line.strip():
+                yield line
+    if remainder.strip():
+        yield remainder
+
+
+def as_records(times):
+    """Group a flat array of times into records of four"""
+    return zip(*[iter(times)] * 4)
+
+
+def times_totals(times) -> tuple:
+    """Worked seconds and number of days of a flat array of times"""
+    starts = times[0::4]
+    if SUMMARY in starts or 0 in times:
+        totals = [record_totals(record) for record in as_records(times)]
+        return sum(seconds for seconds, _ in totals), sum(days for _, days in totals)
+    return sum(times[3::4]) - sum(starts) - (sum(times[2::4]) - sum(times[1::4])), len(starts)
+
+
+class TextDaysFile:
+    """
+    Days file with one line of four space separated epochs per day. Lines
+    that aren't four integers are skipped, and their numbers are kept in
+    malformed.
+
+    This is also the interface of the days file formats. Formats that can
+    total the days without reading them all set indexed and add totals()
+    and week_records().
+    """
+    header = b''
+    indexed = False
+
+    def __init__(self, path):
+        self.path = path
+        self.malformed = []
+
+    @staticmethod
+    def split(data: bytes) -> tuple:
+        """Split data into its complete records and any trailing partial one"""
+        cut = data.rfind(b'\n') + 1
+        return data[:cut], data[cut:]
+
+    def parse(self, data: bytes, first_line=1) -> array:
+        """
+        The times in data, four per record. The whole of data is tokenised
+        at once, with a marker for each line end, and only if a line doesn't
+        hold four integers is it parsed line by line. first_line is the line
+        number of the start of data, or None to not keep malformed lines.
+        """
+        tokens = data.replace(b'\n', b' | ').split()
+        if len(tokens) % 5 == 0 and tokens[4::5].count(b'|') == len(tokens) // 5:
+            del tokens[4::5]
+            try:
+                return array('q', map(int, tokens))
+            except ValueError:
+                pass
+        times = array('q')
+        for number, line in enumerate(data.split(b'\n')):
+            fields = line.split()
+            if not fields:
+                continue
+            try:
+                if len(fields) != 4:
+                    raise ValueError
+                times.extend([int(field) for field in fields])
+            except ValueError:
+                if first_line is not None:
+                    self.malformed.append(first_line + number)
+        return times
+
+    def parse_partial(self, data: bytes) -> array:
+        """Parse what can be read of a trailing partial record"""
+        return self.parse(data, first_line=None)
+
+    @staticmethod
+    def encode(record: tuple) -> bytes:
+        return '{} {} {} {}\n'.format(*record).encode()
+
+    def times(self) -> array:
+        """The times of all records, four per record"""
+        with open(self.path, 'rb') as file:
+            return self.parse(file.read())
+
+    def records(self):
+        yield from as_records(self.times())
+
+    def chunks(self, size=1 << 20):
+        """The times of all records, four per record, read size bytes at a time"""
+        with open(self.path, 'rb') as file:
+            file.seek(len(self.header))
+            remainder = b''
+            line = 1
+            for data in iter(lambda: file.read(size), b''):
+                complete, remainder = self.split(remainder + data)
+                yield self.parse(complete, first_line=line)
+                line += complete.count(b'\n')
+        yield self.parse_partial(remainder)
+
+    def reversed_records(self):
+        with open(self.path, 'rb') as file:
+            for line in reversed_lines(file):
+                yield from as_records(self.parse(line, first_line=None))
+
+    def create(self) -> None:
+        with open(self.path, 'wb') as file:
+            file.write(self.header)
+
+    def append(self, record: tuple) -> None:
+        self.extend((record,))
+
+    def extend(self, records) -> None:
+        with open(self.path, 'ab') as file:
+            if file.tell() == 0:
+                file.write(self.header)
+            file.write(b''.join(self.encode(record) for record in records))
+
+    def write(self, records) -> None:
+        """Atomically replace the days file with records"""
+        with replacing(self.path) as temporary:
+            with open(temporary, 'wb') as file:
+                file.write(self.header)
+                for record in records:
+                    file.write(self.encode(record))
+
+
+class BinaryDaysFile(TextDaysFile):
+    """
+    Days file of fixed size records, four little endian int64 epochs per day,
+    after a header of the same size. Records are read through mmap, so any
+    one of them can be reached without parsing the ones before it.
+    """
+    header = BINARY_MAGIC.ljust(RECORD.size, b'\0')
+
+    @staticmethod
+    def split(data: bytes) -> tuple:
+        cut = len(data) - len(data) % RECORD.size
+        return data[:cut], data[cut:]
+
+    def parse(self, data: bytes, first_line=1) -> array:
+        times = array('q', data)
+        if sys.byteorder == 'big':
+            times.byteswap()
+        return times
+
+    def parse_partial(self, data: bytes) -> array:
+        return array('q')
+
+    @staticmethod
+    def encode(record: tuple) -> bytes:
+        return RECORD.pack(*record)
+
+    def _map(self, file):
+        if os.fstat(file.fileno()).st_size <= len(self.header):
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return (os.path.getsize(self.path) - len(self.header)) // RECORD.size
+
+    def record(self, index: int) -> tuple:
+        with open(self.path, 'rb') as file:
+            file.seek(len(self.header) + index * RECORD.size)
+            return RECORD.unpack(file.read(RECORD.size))
+
+    def times(self) -> array:
+        with open(self.path, 'rb') as file:
+            days = self._map(file)
+            if days is None:
+                return array('q')
+            with days:
+                data, _ = self.split(days[len(self.header):])
+        return self.parse(data)
+
+    def reversed_records(self):
+        with open(self.path, 'rb') as file:
+            days = self._map(file)
+            if days is None:
+                return
+            with days:
+                end = len(days) - (len(days) - len(self.header)) % RECORD.size
+                for offset in range(end - RECORD.size, len(self.header) - 1, -RECORD.size):
+                    yield RECORD.unpack_from(days, offset)
+
+
+class SqliteDaysFile(TextDaysFile):
+    """
+    Days kept in an SQLite database, along with the ISO year * 100 + week,
+    worked seconds and number of days of each record, and indexed on start
+    and week. Totals and the days of a week are then queries rather than
+    reads of the whole history. Records keep the order they were added in.
+    """
+    indexed = True
+
+    def _connect(self):
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        return closing(sqlite3.connect(self.path))
+
+    def _query(self, query: str, parameters=()) -> list:
+        with self._connect() as connection:
+            return connection.execute(query, parameters).fetchall()
+
+    def times(self) -> array:
+        return array('q', chain.from_iterable(self._query(
+            'SELECT start_day, start_lunch, end_lunch, end_day FROM days ORDER BY rowid'
+        )))
+
+    def chunks(self, size=1 << 20):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'SELECT start_day, start_lunch, end_lunch, end_day FROM days ORDER BY rowid'
+            )
+            for rows in iter(lambda: cursor.fetchmany(size // RECORD.size), []):
+                yield array('q', chain.from_iterable(rows))
+
+    def reversed_records(self):
+        with self._connect() as connection:
+            yield from connection.execute(
+                'SELECT start_day, start_lunch, end_lunch, end_day FROM days ORDER BY rowid DESC'
+            )
+
+    def totals(self) -> tuple:
+        """Worked seconds and number of days of all records"""
+        return self._query('SELECT coalesce(sum(seconds), 0), coalesce(sum(days), 0) FROM days')[0]
+
+    def week_records(self, year: int, week: int) -> list:
+        """The day records of the ISO week"""
+        return self._query(
+            'SELECT start_day, start_lunch, end_lunch, end_day FROM days '
+            'WHERE week = ? AND start_day != ? ORDER BY rowid',
+            (year * 100 + week, SUMMARY),
+        )
+
+    @staticmethod
+    def _row(record: tuple) -> tuple:
+        year, week = record_week(record)
+        return (*record, year * 100 + week, *record_totals(record))
+
+    def _insert(self, path: str, records) -> None:
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        with closing(sqlite3.connect(path)) as connection:
+            # The connection commits the block, or rolls it back if it raises
+            with connection:
+                for statement in SQLITE_SCHEMA:
+                    connection.execute(statement)
+                connection.executemany(
+                    'INSERT INTO days VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (self._row(record) for record in records),
+                )
+
+    def create(self) -> None:
+        self._insert(self.path, ())
+
+    def extend(self, records) -> None:
+        self._insert(self.path, records)
+
+    def write(self, records) -> None:
+        with replacing(self.path) as temporary:
+            self._insert(temporary, records)
+
+
+DAYS_FORMATS = {
+    'text': TextDaysFile,
+    'binary': BinaryDaysFile,
+    'sqlite': SqliteDaysFile,
+}
+
+
+def open_days_file(path: str) -> TextDaysFile:
+    """Return a days file of the format found in path, text if it's missing"""
+    try:
+        with open(path, 'rb') as file:
+            magic = file.read(len(SQLITE_MAGIC))
+    except FileNotFoundError:
+        magic = b''
+    if magic.startswith(BINARY_MAGIC):
+        return BinaryDaysFile(path)
+    if magic == SQLITE_MAGIC:
+        return SqliteDaysFile(path)
+    return TextDaysFile(path)
+
+
+def warn_malformed(days: TextDaysFile) -> None:
+    """Report the malformed lines skipped when reading days, once"""
+    if days.malformed:
+        sys.stderr.write('Skipped malformed lines {} of {}\n'.format(
+            ', '.join(str(line) for line in days.malformed),
+            days.path,
+        ))
+        days.malformed.clear()
+
+
+def check_malformed(days: TextDaysFile) -> None:
+    """Refuse to rewrite days while it has malformed lines, which the rewrite would drop"""
+    if days.malformed:
+        raise ValueError('Malformed lines {} of {}, fix or remove them first'.format(
+            ', '.join(str(line) for line in days.malformed),
+            days.path,
+        ))
+
+
+def convert_days_file(source: str, target: str, binary=False, days_format=None) -> None:
+    """
+    Write the days in source to target, in binary or text format, or in the
+    format of DAYS_FORMATS named by days_format
+    """
+    source_days = open_days_file(source)
+    days = list(source_days.records())
+    check_malformed(source_days)
+    if days_format is None:
+        days_format = 'binary' if binary else 'text'
+    DAYS_FORMATS[days_format](target).write(days)
+
+
+@contextmanager
+def replacing(path: str, sync=False):
+    """
+    Yield a temporary path next to path, which replaces path in one step
+    once the block is done, keeping its mode. A symlinked path has its
+    target replaced. With sync, the data is flushed to disk first.
+    """
+    path = os.path.realpath(path)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        yield temporary
+        import shutil  # pylint: disable=import-outside-toplevel
+        try:
+            shutil.copymode(path, temporary)
+        except FileNotFoundError:
+            pass
+        if sync:
+            with open(temporary, 'rb+') as file:
+                os.fsync(file.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+class StateFile:
+    """
+    The times of the day in progress, four little endian int64 epochs after
+    a header and a sequence number. They are read with pread and updated in
+    place with pwrite. The sequence number is odd while a write is in
+    progress, so readers can detect a torn read and retry.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> tuple:
+        descriptor = os.open(self.path, os.O_RDONLY)
+        try:
+            data = os.pread(descriptor, len(STATE_MAGIC) + STATE.size, 0)
+            if len(data) != len(STATE_MAGIC) + STATE.size or not data.startswith(STATE_MAGIC):
+                raise ValueError(f'{self.path} is not a state file')
+            for _ in range(STATE_READ_RETRIES):
+                sequence, *record = STATE.unpack_from(data, len(STATE_MAGIC))
+                if sequence % 2 == 0:
+                    check, = SEQUENCE.unpack(os.pread(descriptor, SEQUENCE.size, len(STATE_MAGIC)))
+                    if check == sequence:
+                        break
+                data = os.pread(descriptor, len(STATE_MAGIC) + STATE.size, 0)
+            # Past the retries a writer died during a write, use what is there
+            return tuple(record)
+        finally:
+            os.close(descriptor)
+
+    def write(self, record: tuple) -> None:
+        descriptor = os.open(self.path, os.O_RDWR)
+        try:
+            sequence, = SEQUENCE.unpack(os.pread(descriptor, SEQUENCE.size, len(STATE_MAGIC)))
+            sequence += 1 if sequence % 2 == 0 else 2
+            os.pwrite(descriptor, SEQUENCE.pack(sequence), len(STATE_MAGIC))
+            os.pwrite(descriptor, RECORD.pack(*record), len(STATE_MAGIC) + SEQUENCE.size)
+            os.pwrite(descriptor, SEQUENCE.pack(sequence + 1), len(STATE_MAGIC))
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def create(self, record: tuple) -> None:
+        with replacing(self.path, sync=True) as temporary:
+            with open(temporary, 'wb') as file:
+                file.write(STATE_MAGIC + STATE.pack(0, *record))
+
+
+class Profiler:
+    """
+    Wall time and net allocated memory blocks of the phases of one run:
+    import, config, parse, aggregate and format, as well as cache and daemon
+    lookups. Enabled with --profile [FILE] or WORKDAY_PROFILE=1|FILE, and
+    written to stderr, or appended to FILE as one JSON line per run.
+    --profile-dump FILE or WORKDAY_PROFILE_DUMP=FILE also stores cProfile
+    statistics of the run. Interpreter startup is not included, see
+    python -X importtime for that.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.output = None
+        self.dump = None
+        self.phases = []
+
+    def configure(self, argv: list, environment) -> list:
+        """Enable profiling from argv and environment, return argv without the profiling options"""
+        self.output = environment.get('WORKDAY_PROFILE')
+        self.dump = environment.get('WORKDAY_PROFILE_DUMP')
+        # Unset, empty and 0 all leave profiling off
+        if self.output in ('', '0'):
+            self.output = None
+        if self.dump in ('', '0'):
+            self.dump = None
+        remaining = []
+        index = 0
+        while index < len(argv):
+            argument = argv[index]
+            following = argv[index + 1] if index + 1 < len(argv) else None
+            if argument == '--profile':
+                self.output = '-'
+                if following is not None and not following.startswith('-'):
+                    self.output = following
+                    index += 1
+            elif argument == '--profile-dump':
+                self.dump = following
+                index += 1
+            else:
+                remaining.append(argument)
+            index += 1
+        self.enabled = self.output is not None or self.dump is not None
+        if self.enabled:
+            self.phases = [{
+                'phase': 'import',
+                'seconds': IMPORT_TIME[0],
+                'blocks': IMPORT_TIME[1],
+            }]
+        return remaining
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        blocks = sys.getallocatedblocks()
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'phase': name,
+                'seconds': perf_counter() - started,
+                'blocks': sys.getallocatedblocks() - blocks,
+            })
+
+    def emit(self, argv: list) -> None:
+        if self.output is None:
+            return
+        if self.output in ('-', '1'):
+            for phase in self.phases:
+                sys.stderr.write('{phase:>10} {milliseconds:9.3f} ms {blocks:+8} blocks\n'.format(
+                    milliseconds=phase['seconds'] * 1000,
+                    **phase,
+                ))
+            return
+        import json  # pylint: disable=import-outside-toplevel
+        with open(self.output, 'a') as file:
+            profile = {'time': datetime.now().timestamp(), 'argv': argv, 'phases': self.phases}
+            file.write(json.dumps(profile) + '\n')
+
+
+PROFILER = Profiler()
+
+
 def total_format(week_total: timedelta) -> str:
     if week_total != timedelta():
         return f'  -----\n  Total: {time_format(week_total)}'
@@ -72,29 +611,62 @@ def total_format(week_total: timedelta) -> str:
 
 
 class Day:
-    def __init__(self, start_day=0, start_lunch=0, end_lunch=0, end_day=0):
-        now = datetime.now()
-        self.start_day = now if start_day == 0 else datetime.fromtimestamp(start_day)
-        self.start_lunch = now if start_lunch == 0 else datetime.fromtimestamp(start_lunch)
-        self.end_lunch = now if end_lunch == 0 else datetime.fromtimestamp(end_lunch)
-        self.end_day = now if end_day == 0 else datetime.fromtimestamp(end_day)
+    """
+    A day of four epochs, where 0 means now, or the given now. The datetimes
+    are only built when one of them is asked for.
+    """
+    __slots__ = ('_times', '_now', '_datetimes')
+
+    def __init__(self, start_day=0, start_lunch=0, end_lunch=0, end_day=0, now=None):
+        self._set_times((start_day, start_lunch, end_lunch, end_day), now)
+
+    def _set_times(self, times: tuple, now=None) -> None:
+        self._times = times
+        self._now = None
+        if 0 in times:
+            self._now = datetime.now() if now is None else now
+        self._datetimes = None
+
+    def _datetime(self, index: int) -> datetime:
+        if self._datetimes is None:
+            self._datetimes = tuple(
+                self._now if time == 0 else datetime.fromtimestamp(time)
+                for time in self._times
+            )
+        return self._datetimes[index]
+
+    @property
+    def start_day(self) -> datetime:
+        return self._datetime(0)
+
+    @property
+    def start_lunch(self) -> datetime:
+        return self._datetime(1)
+
+    @property
+    def end_lunch(self) -> datetime:
+        return self._datetime(2)
+
+    @property
+    def end_day(self) -> datetime:
+        return self._datetime(3)
 
     def from_line(self, line) -> None:
-        times = line.strip().split(' ')
-        self.start_day = datetime.fromtimestamp(int(times[0]))
-        self.start_lunch = datetime.fromtimestamp(int(times[1]))
-        self.end_lunch = datetime.fromtimestamp(int(times[2]))
-        self.end_day = datetime.fromtimestamp(int(times[3]))
+        self._set_times(tuple(int(time) for time in line.strip().split(' ')))
 
     def to_line(self) -> str:
-        return '{} {} {} {}\n'.format(
-            int(datetime.timestamp(self.start_day)),
-            int(datetime.timestamp(self.start_lunch)),
-            int(datetime.timestamp(self.end_lunch)),
-            int(datetime.timestamp(self.end_day)),
-        )
+        return '{} {} {} {}\n'.format(*self.to_record())
+
+    def to_record(self) -> tuple:
+        if self._now is None:
+            return self._times
+        now = int(datetime.timestamp(self._now))
+        return tuple(now if time == 0 else time for time in self._times)
 
     def day_time(self) -> timedelta:
+        if self._now is None:
+            start_day, start_lunch, end_lunch, end_day = self._times
+            return timedelta(seconds=end_day - start_day - (end_lunch - start_lunch))
         return self.end_day-self.start_day-(self.end_lunch-self.start_lunch)
 
     def until_workday_done(self) -> timedelta:
@@ -104,139 +676,1603 @@ class Day:
     def week(self):
         return self.start_day.isocalendar()[1]
 
+    @property
+    def iso_week(self) -> tuple:
+        """The ISO (year, week), as week numbers repeat every year"""
+        return tuple(self.start_day.isocalendar()[:2])
+
     @property
     def day_name(self):
         return self.start_day.strftime('%A')
 
 
+def week_start(year: int, week: int) -> datetime:
+    """Local midnight of the Monday of the ISO week"""
+    return datetime.strptime(f'{year}-W{week}-1', '%G-W%V-%u')
+
+
+def summary_record(year: int, week: int, seconds: int, days: int) -> tuple:
+    """A record that stands in for the days of a compacted week"""
+    return (SUMMARY, year * 100 + week, seconds, days)
+
+
+def record_week(record: tuple) -> tuple:
+    """The ISO (year, week) of a day or summary record"""
+    if record[0] == SUMMARY:
+        return divmod(record[1], 100)
+    return Day(*record).iso_week
+
+
+def record_start(record: tuple) -> int:
+    """The epoch a day or summary record starts at, the Monday of a summary's week"""
+    if record[0] == SUMMARY:
+        return int(week_start(*record_week(record)).timestamp())
+    return record[0]
+
+
+def record_totals(record: tuple) -> tuple:
+    """Worked seconds and number of days of a day or summary record"""
+    if record[0] == SUMMARY:
+        return record[2], record[3]
+    return int(Day(*record).day_time().total_seconds()), 1
+
+
+class Calendar:
+    """
+    Target seconds of work per weekday, WORKDAY_HOURS on every weekday
+    unless set, and per date for holidays and other exceptions. A calendar
+    file has a weekday name or YYYY-MM-DD date and its hours, like 7.5 or
+    7:30, on each line.
+
+    A compacted week is taken to be its first days from Monday.
+    """
+    def __init__(self, weekdays=None, dates=None, path=None):
+        self.weekdays = [WORKDAY_HOURS * 3600] * 7 if weekdays is None else list(weekdays)
+        self.dates = {} if dates is None else dict(dates)
+        self.path = path
+        uniform = set(self.weekdays)
+        self.uniform = uniform.pop() if len(uniform) == 1 and not self.dates else None
+        # Identifies the targets in checkpoints, which are rebuilt when it changes
+        targets = repr((self.weekdays, sorted(self.dates.items())))
+        self.key = '{:08x}'.format(crc32(targets.encode()))
+
+    @classmethod
+    def from_file(cls, path=None) -> 'Calendar':
+        """The calendar in path, or the default one if path is None"""
+        if path is None:
+            return cls()
+        weekdays = [WORKDAY_HOURS * 3600] * 7
+        dates = {}
+        with open(path) as file:
+            for number, line in enumerate(file, 1):
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    key, hours = line.split()
+                    if ':' in hours:
+                        hour, minute = hours.split(':')
+                        seconds = int(hour) * 3600 + int(minute) * 60
+                    else:
+                        seconds = int(float(hours) * 3600)
+                    if key.lower() in WEEKDAYS:
+                        weekdays[WEEKDAYS.index(key.lower())] = seconds
+                    else:
+                        dates[datetime.strptime(key, '%Y-%m-%d').date()] = seconds
+                except ValueError:
+                    raise ValueError(
+                        f'Line {number} of {path} is not a weekday or date and hours: {line}'
+                    ) from None
+        return cls(weekdays, dates, path)
+
+    def target(self, day) -> int:
+        """Target seconds of the date day"""
+        if self.uniform is not None:
+            return self.uniform
+        return self.dates.get(day, self.weekdays[day.weekday()])
+
+    def week_target(self, year: int, week: int, days=7) -> int:
+        """Target seconds of the first days of the ISO week"""
+        if self.uniform is not None:
+            return self.uniform * days
+        monday = week_start(year, week).date()
+        return sum(self.target(monday + timedelta(days=offset)) for offset in range(days))
+
+    def record_target(self, record: tuple) -> int:
+        """Target seconds of a day or summary record"""
+        if record[0] == SUMMARY:
+            return self.week_target(*record_week(record), days=record[3])
+        if self.uniform is not None:
+            return self.uniform
+        return self.target(Day(*record).start_day.date())
+
+    def times_target(self, times) -> int:
+        """Target seconds of a flat array of times"""
+        starts = times[0::4]
+        if self.uniform is not None and SUMMARY not in starts:
+            return self.uniform * len(starts)
+        return sum(self.record_target(record) for record in as_records(times))
+
+
+DEFAULT_CALENDAR = Calendar()
+
+
+class DayLog:
+    """
+    Logged days kept as array columns of epochs rather than Day objects.
+    Indexing or iterating gives Day views built from the columns.
+
+    Days are appended in order, so the start column is sorted and doubles as
+    an index on date and ISO (year, week), and prefix and day_counts hold
+    the cumulative worked seconds and days, and targets the cumulative
+    target seconds of calendar. Totals over any range of days are two
+    bisections away.
+
+    A summary record of a compacted week is kept as a day that starts on its
+    Monday and lasts the worked seconds of the week, and the record itself
+    is kept in summaries by index.
+    """
+    def __init__(self, records=(), calendar=DEFAULT_CALENDAR):
+        self.columns = tuple(array('q') for _ in range(4))
+        self.prefix = array('q', [0])
+        self.day_counts = array('q', [0])
+        self.targets = array('q', [0])
+        self.calendar = calendar
+        self.summaries = {}
+        for record in records:
+            self.append(record)
+
+    def append(self, record: tuple) -> None:
+        days = 1
+        self.targets.append(self.targets[-1] + self.calendar.record_target(record))
+        if record[0] == SUMMARY:
+            self.summaries[len(self)] = record
+            _, _, seconds, days = record
+            monday = int(week_start(*record_week(record)).timestamp())
+            record = (monday, monday, monday, monday + seconds)
+        for column, time in zip(self.columns, record):
+            column.append(time)
+        self.prefix.append(self.prefix[-1] + self.day_seconds(-1))
+        self.day_counts.append(self.day_counts[-1] + days)
+
+    def extend(self, times) -> None:
+        """
+        Append the records of a flat array of times, four per record. The
+        columns and sums are built from slices of times, except for the
+        summaries of compacted weeks, which are appended one at a time.
+        """
+        starts = times[0::4]
+        summaries = 0
+        while summaries < len(starts) and starts[summaries] == SUMMARY:
+            summaries += 1
+        if SUMMARY in starts[summaries:]:
+            summaries = len(starts)
+        for record in islice(as_records(times), summaries):
+            self.append(record)
+        times = times[summaries * 4:]
+        columns = [times[index::4] for index in range(4)]
+        for column, new in zip(self.columns, columns):
+            column.extend(new)
+        start_day, start_lunch, end_lunch, end_day = columns
+        worked = map(sub, map(sub, end_day, start_day), map(sub, end_lunch, start_lunch))
+        self.prefix.extend(islice(accumulate(chain((self.prefix[-1],), worked)), 1, None))
+        first = self.day_counts[-1] + 1
+        self.day_counts.extend(range(first, first + len(start_day)))
+        if self.calendar.uniform is None:
+            targets = map(self.calendar.record_target, as_records(times))
+        else:
+            targets = (self.calendar.uniform for _ in start_day)
+        self.targets.extend(islice(accumulate(chain((self.targets[-1],), targets)), 1, None))
+
+    def __len__(self) -> int:
+        return len(self.columns[0])
+
+    def __getitem__(self, index: int) -> Day:
+        return Day(*(column[index] for column in self.columns))
+
+    def __iter__(self):
+        return self.days_at()
+
+    def days_at(self, now=None):
+        """Day views, where 0 means now, or the given now"""
+        for record in zip(*self.columns):
+            yield Day(*record, now=now)
+
+    def records(self):
+        if not self.summaries:
+            return zip(*self.columns)
+        return (
+            self.summaries.get(index, record)
+            for index, record in enumerate(zip(*self.columns))
+        )
+
+    def day_seconds(self, index: int) -> int:
+        start_day, start_lunch, end_lunch, end_day = self.columns
+        return end_day[index] - start_day[index] - (end_lunch[index] - start_lunch[index])
+
+    def seconds(self, low: int, high: int) -> int:
+        """Worked seconds of the days from index low up to high"""
+        return self.prefix[high] - self.prefix[low]
+
+    def days(self, low: int, high: int) -> int:
+        """Number of days from index low up to high, counting those of summaries"""
+        return self.day_counts[high] - self.day_counts[low]
+
+    def target(self, low: int, high: int) -> int:
+        """Target seconds of the days from index low up to high"""
+        return self.targets[high] - self.targets[low]
+
+    def bisect(self, time: datetime, high=None) -> int:
+        """Index of the first day starting at or after time"""
+        high = len(self) if high is None else high
+        return bisect_left(self.columns[0], int(time.timestamp()), 0, high)
+
+    def date_range(self, start: datetime, end: datetime, high=None) -> tuple:
+        """Indexes low and high of the days starting from start until end"""
+        return self.bisect(start, high), self.bisect(end, high)
+
+    def week_range(self, year: int, week: int, high=None) -> tuple:
+        """Indexes low and high of the days in the ISO week"""
+        monday = week_start(year, week)
+        return self.date_range(monday, monday + timedelta(days=7), high)
+
+
+def default_config_file() -> str:
+    home = os.path.expanduser('~')
+    if os.name == 'nt':
+        return f'{home}\\workday.yaml'
+    return f'{home}/.config/workday.yaml'
+
+
+def load_config(configfile):
+    from pyyamlconfig import load_config as load  # pylint: disable=import-outside-toplevel
+    return load(configfile)
+
+
+def write_config(configfile, content):
+    from pyyamlconfig import write_config as write  # pylint: disable=import-outside-toplevel
+    write(configfile, content)
+
+
+def parse_scalar(value: str):
+    """
+    Parse a YAML scalar that is an integer or a plain string, raise
+    ValueError for anything YAML might read differently.
+    """
+    digits = value[1:] if value.startswith('-') else value
+    if digits.isdigit() and (digits == '0' or not digits.startswith('0')):
+        return int(value)
+    drive = value[1:3] in (':\\', ':/') and value[0].isalpha()
+    if (
+        value.lower() in YAML_SPECIAL
+        or value[0] in '-?:,[]{}#&*!|>%@`\'"+.=<' or value[0].isdigit()
+        or ':' in (value[3:] if drive else value)
+        or ' #' in value
+    ):
+        raise ValueError(f'Not a simple scalar: {value}')
+    return value
+
+
+def read_simple_config(configfile) -> dict:
+    """
+    Read a config of top level "key: value" lines with integer or plain
+    string values, without importing yaml. Raises ValueError for anything
+    else, in which case the config should be read with load_config().
+    """
+    config = {}
+    with open(configfile) as file:
+        for line in file:
+            if not line.strip() or line.startswith('#'):
+                continue
+            key, separator, value = line.rstrip('\n').partition(': ')
+            if not separator or not key or key[0] in ' \t-?' or parse_scalar(key) != key:
+                raise ValueError(f'Not a simple line: {line}')
+            config[key] = parse_scalar(value.strip())
+    return config
+
+
+def read_config(configfile) -> dict:
+    try:
+        return read_simple_config(configfile)
+    except (OSError, UnicodeDecodeError, ValueError):
+        pass
+    return load_config(configfile)
+
+
+def stat_key(paths) -> tuple:
+    """Identify the current contents of paths by their stat information"""
+    key = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            key.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        except (OSError, TypeError):
+            key.append(None)
+    return tuple(key)
+
+
 class Workday:
-    def __init__(self, configfile=None):
+    def __init__(self, configfile=None, current_week=None):
+        """current_week is an ISO (year, week), this week unless given"""
         if configfile is None:
-            if os.name == 'nt':
-                configfile = f'{Path.home()}\workday.yaml'
-            else:
-                configfile = f'{Path.home()}/.config/workday.yaml'
+            configfile = default_config_file()
         self.configfile = configfile
-        self.config = load_config(configfile)
+        with PROFILER.phase('config'):
+            self.config = read_config(configfile)
+        self.current_week = CURRENT_ISO_WEEK if current_week is None else current_week
         self.days_file = self.config.get('days_file')
+        self.calendar = DEFAULT_CALENDAR
+        if self.config.get('calendar_file'):
+            self.calendar = Calendar.from_file(os.path.expanduser(self.config['calendar_file']))
         self.until_today = timedelta()
         self.until_today_days = 0
+        self.until_today_target = 0
         self.total_time = timedelta()
         self.total_days = 0
         self.week_days = []
-        self.all_days = []
+        self.all_days = DayLog(calendar=self.calendar)
+        self.earlier_flex = timedelta()
+        self._config_batches = 0
+        self._config_changed = set()
+        self.state = None
+        if self.config.get('state_file'):
+            self.state = StateFile(os.path.expanduser(self.config['state_file']))
+            self.read_state()
+
+    def read_state(self) -> None:
+        """
+        Read the times of the day in progress from the state file, if one is
+        configured. A missing state file is created from the times in the
+        config.
+        """
+        if self.state is None:
+            return
+        try:
+            record = self.state.read()
+        except FileNotFoundError:
+            record = self.current_record()
+            self.state.create(record)
+        self.config.update(zip(DAY_KEYS, record))
 
     def load(self) -> None:
+        """Load all logged days, replacing what an earlier load read"""
+        self.week_days = []
+        self.all_days = DayLog(calendar=self.calendar)
+        days = open_days_file(self.days_file)
         try:
-            with open(self.days_file) as file:
-                for line in file.readlines():
-                    day = Day()
-                    day.from_line(line)
-
-                    self.all_days.append(day)
-                    self.until_today += day.day_time()
-                    self.until_today_days += 1
-                    if day.week == CURRENT_WEEK:
-                        self.week_days.append(day)
-                self.all_days.append(self.current_day())
-                self.total_time = self.until_today + self.current_day().day_time()
-                self.total_days = self.until_today_days + 1
+            with PROFILER.phase('parse'):
+                times = days.times()
         except FileNotFoundError:
-            open(self.days_file, 'w').close()
+            days.create()
+            return
+        warn_malformed(days)
+        with PROFILER.phase('aggregate'):
+            self.all_days.extend(times)
+            low, high = self.all_days.week_range(*self.current_week)
+            self.week_days = [self.all_days[index] for index in range(low, high)]
+            self.until_today = timedelta(seconds=self.all_days.prefix[-1])
+            self.until_today_days = self.all_days.day_counts[-1]
+            self.until_today_target = self.all_days.targets[-1]
+            self.all_days.append(self.current_record())
+            self.total_time = self.until_today + self.all_days[-1].day_time()
+            self.total_days = self.until_today_days + 1
+
+    @property
+    def checkpoint_file(self) -> str:
+        return f'{self.days_file}.checkpoint'
+
+    def read_checkpoint(self, file) -> dict:
+        """
+        Return the stored checkpoint if it still describes the start of the
+        open days file, otherwise an empty checkpoint to rebuild from.
+        """
+        checkpoint = dict(EMPTY_CHECKPOINT)
+        read = set()
+        try:
+            with open(self.checkpoint_file) as checkpoint_file:
+                for line in checkpoint_file:
+                    key, _, value = line.rstrip('\n').partition(' ')
+                    if key in checkpoint:
+                        checkpoint[key] = type(EMPTY_CHECKPOINT[key])(value)
+                        read.add(key)
+        except (OSError, ValueError):
+            return dict(EMPTY_CHECKPOINT)
+        if len(read) != len(EMPTY_CHECKPOINT) or checkpoint['calendar'] != self.calendar.key:
+            return dict(EMPTY_CHECKPOINT)
+        stat = os.fstat(file.fileno())
+        offset = checkpoint['offset']
+        if (
+            stat.st_size < offset
+            or stat.st_ino != checkpoint['inode']
+            or (stat.st_size == checkpoint['size'] and stat.st_mtime_ns != checkpoint['mtime'])
+        ):
+            return dict(EMPTY_CHECKPOINT)
+        tail = bytes.fromhex(checkpoint['tail'])
+        file.seek(offset - len(tail))
+        if file.read(len(tail)) != tail:
+            return dict(EMPTY_CHECKPOINT)
+        return checkpoint
+
+    def write_checkpoint(self, checkpoint: dict) -> None:
+        """Write the checkpoint as "key value" lines, which parse without json"""
+        with replacing(self.checkpoint_file) as temporary:
+            with open(temporary, 'w') as file:
+                for key, value in checkpoint.items():
+                    file.write(f'{key} {value}\n')
+
+    def load_incremental(self, read_only=False) -> None:
+        """
+        Load only what tmux_status() needs. Flex comes from the checkpoint
+        next to the days file, parsing just the days appended since it was
+        written, and the current week is read backwards from the end of the
+        file. The checkpoint is rebuilt from scratch if the days file has
+        shrunk or been rewritten. Unlike load(), all_days is left empty.
+        With read_only, neither the checkpoint nor a missing days file is
+        written.
+        """
+        self.week_days = []
+        days = open_days_file(self.days_file)
+        if days.indexed:
+            with PROFILER.phase('aggregate'):
+                self.week_days = [Day(*record) for record in days.week_records(*self.current_week)]
+                seconds, count = days.totals()
+                if self.calendar.uniform is None:
+                    target = self.calendar.times_target(days.times())
+                else:
+                    target = self.calendar.uniform * count
+                self._set_totals(timedelta(seconds=seconds), count, target)
+            return
+        try:
+            file = open(self.days_file, 'rb')
+        except FileNotFoundError:
+            if not read_only:
+                days.create()
+            return
+        with file, PROFILER.phase('parse'):
+            checkpoint = self.read_checkpoint(file)
+            offset = max(checkpoint['offset'], len(days.header))
+            file.seek(offset)
+            complete, partial = days.split(file.read())
+            stat = os.fstat(file.fileno())
+            for record in days.reversed_records():
+                if record_week(record) != self.current_week:
+                    break
+                self.week_days.append(Day(*record))
+            self.week_days.reverse()
+
+        with PROFILER.phase('aggregate'):
+            self._update_totals(days, checkpoint, offset, complete, partial, stat, read_only)
+
+    def _update_totals(self, days, checkpoint, offset, complete, partial, stat, read_only) -> None:
+        updated = dict(checkpoint)
+        times = days.parse(complete, first_line=checkpoint['lines'] + 1)
+        warn_malformed(days)
+        seconds, count = times_totals(times)
+        updated['until_today'] += seconds
+        updated['until_today_days'] += count
+        updated['target'] += self.calendar.times_target(times)
+        updated['calendar'] = self.calendar.key
+        updated['lines'] += complete.count(b'\n')
+        updated['offset'] = offset + len(complete)
+        if complete:
+            updated['tail'] = complete[-RECORD.size:].hex()
+        updated['size'] = stat.st_size
+        updated['mtime'] = stat.st_mtime_ns
+        updated['inode'] = stat.st_ino
+
+        # A day still being written is counted, but not checkpointed
+        times = days.parse_partial(partial)
+        seconds, count = times_totals(times)
+        self._set_totals(
+            timedelta(seconds=updated['until_today'] + seconds),
+            updated['until_today_days'] + count,
+            updated['target'] + self.calendar.times_target(times),
+        )
+        if updated != checkpoint and not read_only:
+            try:
+                self.write_checkpoint(updated)
+            except OSError:
+                # The checkpoint is only a cache, the next load rebuilds it
+                pass
+
+    def _set_totals(
+            self, until_today: timedelta, until_today_days: int, until_today_target: int,
+    ) -> None:
+        self.until_today = until_today
+        self.until_today_days = until_today_days
+        self.until_today_target = until_today_target
+        self.total_time = self.until_today + self.current_day().day_time()
+        self.total_days = self.until_today_days + 1
+
+    def source_files(self) -> list:
+        """The files whose contents decide the state of this Workday"""
+        files = [self.configfile, self.days_file]
+        if self.state is not None:
+            files.append(self.state.path)
+        if self.calendar.path is not None:
+            files.append(self.calendar.path)
+        return files
 
     def set_config(self, parameter, value):
         self.config[parameter] = value
-        write_config(self.configfile, self.config)
+        self._config_changed.add(parameter)
+        if not self._config_batches:
+            self.save_config()
+
+    def set_config_many(self, values: dict) -> None:
+        with self.batch_config():
+            for parameter, value in values.items():
+                self.set_config(parameter, value)
+
+    @contextmanager
+    def batch_config(self):
+        """
+        Collect the set_config() calls made inside the block and write the
+        config once at the end. If the block raises, the config is rolled
+        back and nothing is written.
+        """
+        original = dict(self.config)
+        if self._config_batches == 0:
+            self._config_changed = set()
+        self._config_batches += 1
+        try:
+            yield self
+        except BaseException:
+            if self._config_batches == 1:
+                self.config.clear()
+                self.config.update(original)
+                self._config_changed = set()
+            raise
+        finally:
+            self._config_batches -= 1
+        if self._config_batches == 0 and self._config_changed:
+            self.save_config()
+
+    def save_config(self) -> None:
+        """
+        Replace the config file in one step, so readers never see a partial
+        file. With a state file, the times of the day in progress are written
+        there instead, and the config file only if other settings changed.
+        """
+        changed, self._config_changed = self._config_changed, set()
+        config = self.config
+        if self.state is not None:
+            if not changed or changed & set(DAY_KEYS):
+                self.state.write(self.current_record())
+            if changed and changed <= set(DAY_KEYS):
+                return
+            config = {key: value for key, value in config.items() if key not in DAY_KEYS}
+        with replacing(self.configfile, sync=True) as temporary:
+            write_config(temporary, config)
 
     def log_day(self) -> None:
         current_day = self.current_day()
         if current_day.start_day != current_day.end_day:
-            with open(self.days_file, 'a') as file:
-                file.write(current_day.to_line())
+            open_days_file(self.days_file).append(current_day.to_record())
+
+    def compact(self, weeks=None) -> tuple:
+        """
+        Roll the days of the weeks that closed more than weeks ago, by default
+        the compact_weeks of the config, into one summary record per week.
+        Their records are appended to the archive file, the archive_file of
+        the config or the days file with .archive added, before the days file
+        is replaced. Returns the number of days and weeks compacted.
+        """
+        weeks = self.config.get('compact_weeks', COMPACT_WEEKS) if weeks is None else weeks
+        horizon = tuple((week_start(*self.current_week) - timedelta(weeks=weeks)).isocalendar()[:2])
+        days = open_days_file(self.days_file)
+        kept = []
+        archived = []
+        totals = {}
+        for record in days.records():
+            week = record_week(record)
+            if week >= horizon:
+                kept.append(record)
+                continue
+            if record[0] != SUMMARY:
+                archived.append(record)
+            seconds, count = record_totals(record)
+            total = totals.setdefault(week, [0, 0])
+            total[0] += seconds
+            total[1] += count
+        if not archived:
+            return 0, 0
+        check_malformed(days)
+        archive = os.path.expanduser(self.config.get('archive_file', f'{self.days_file}.archive'))
+        open_days_file(archive).extend(archived)
+        summaries = [summary_record(*week, *totals[week]) for week in sorted(totals)]
+        days.write(summaries + kept)
+        return len(archived), len({record_week(record) for record in archived})
+
+    def import_punches(self, path: str, workers=None) -> tuple:
+        """
+        Add the days of a CSV or TSV time clock export to the days file. The
+        export is parsed IMPORT_CHUNK_LINES lines at a time in a process
+        pool, and its punches paired into days by pair_punches(). Days on
+        dates, or in compacted weeks, that are already logged are skipped,
+        and the days file is written once, sorted. Returns the days added,
+        the dates skipped and the dates with an odd number of punches.
+        """
+        with open(path, newline='') as file:
+            lines = file.readlines()
+        delimiter = '\t' if lines and '\t' in lines[0] else ','
+        chunks = [
+            lines[index:index + IMPORT_CHUNK_LINES]
+            for index in range(0, len(lines), IMPORT_CHUNK_LINES)
+        ]
+        if len(chunks) < 2 or workers == 1:
+            parsed = [parse_punches(chunk, delimiter) for chunk in chunks]
+        else:
+            from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(parse_punches, chunks, [delimiter] * len(chunks)))
+        records, unpaired = pair_punches(chain.from_iterable(parsed))
+
+        days = open_days_file(self.days_file)
+        try:
+            existing = list(days.records())
+        except FileNotFoundError:
+            existing = []
+        logged_dates = set()
+        compacted_weeks = set()
+        for record in existing:
+            if record[0] == SUMMARY:
+                compacted_weeks.add(record_week(record))
+            else:
+                logged_dates.add(datetime.fromtimestamp(record[0]).date())
+        added = []
+        skipped = []
+        for record in records:
+            date = datetime.fromtimestamp(record[0]).date()
+            if date in logged_dates or record_week(record) in compacted_weeks:
+                skipped.append(date)
+            else:
+                added.append(record)
+        if added:
+            if not existing or added[0][0] > record_start(existing[-1]):
+                days.extend(added)
+            else:
+                check_malformed(days)
+                days.write(sorted(existing + added, key=record_start))
+        return len(added), skipped, unpaired
 
     def reset(self) -> None:
-        self.set_config('start_day', 0)
-        self.set_config('start_lunch', 0)
-        self.set_config('end_lunch', 0)
-        self.set_config('end_day', 0)
+        self.set_config_many({
+            'start_day': 0,
+            'start_lunch': 0,
+            'end_lunch': 0,
+            'end_day': 0,
+        })
 
     def flex(self) -> timedelta:
-        return self.until_today - timedelta(hours=(self.until_today_days * WORKDAY_HOURS))
+        return self.until_today - timedelta(seconds=self.until_today_target)
 
-    def current_day(self) -> Day:
-        return Day(
-            start_day=self.config.get('start_day', 0),
-            start_lunch=self.config.get('start_lunch', 0),
-            end_lunch=self.config.get('end_lunch', 0),
-            end_day=self.config.get('end_day', 0),
+    def worked_between(self, start: datetime, end: datetime) -> tuple:
+        """
+        Worked time and number of the logged days starting on the dates from
+        start up to and including end. Compacted weeks count if their Monday
+        is in the range. Needs load().
+        """
+        low, high = self._logged_range(start, end)
+        return timedelta(seconds=self.all_days.seconds(low, high)), self.all_days.days(low, high)
+
+    def flex_between(self, start: datetime, end: datetime) -> timedelta:
+        """Flex of the logged days on the dates from start up to and including end"""
+        low, high = self._logged_range(start, end)
+        return timedelta(seconds=self.all_days.seconds(low, high) - self.all_days.target(low, high))
+
+    def _logged_range(self, start: datetime, end: datetime) -> tuple:
+        start = datetime(start.year, start.month, start.day)
+        end = datetime(end.year, end.month, end.day) + timedelta(days=1)
+        logged = max(len(self.all_days) - 1, 0)
+        return self.all_days.date_range(start, end, high=logged)
+
+    def current_record(self) -> tuple:
+        return (
+            self.config.get('start_day', 0),
+            self.config.get('start_lunch', 0),
+            self.config.get('end_lunch', 0),
+            self.config.get('end_day', 0),
         )
 
+    def current_day(self) -> Day:
+        return Day(*self.current_record())
+
+    def snapshot(self, now=None) -> 'Snapshot':
+        """The values of the status at now, by default the current time"""
+        return Snapshot(self, now)
+
     def week_total(self) -> timedelta:
-        total = timedelta()
-        for day in self.week_days:
-            total += day.day_time()
-        total += self.current_day().day_time()
-        return total
+        return self.snapshot().week_total()
 
     def when_leave(self) -> datetime:
         """When you can leave and have zero flex"""
-        return datetime.now() + self.current_day().until_workday_done() - self.flex()
+        return self.snapshot().when_leave()
 
     def full_workday(self) -> datetime:
         """When you have a full workday"""
-        return datetime.now() + self.current_day().until_workday_done()
+        return self.snapshot().full_workday()
 
     def tmux_status(self) -> str:
-        current_day = self.current_day()
+        snapshot = self.snapshot()
         return '{} ({}) | {} | {}'.format(
-            time_format(current_day.day_time(), threshold=(8 * 60 * 60)),
-            time_format(current_day.until_workday_done()),
-            time_format(self.week_total(), threshold=(7 * 8 * 60 * 60)),
-            time_format_absolute(datetime.now(), self.when_leave()),
+            time_format(snapshot.day_time(), threshold=snapshot.day_target()),
+            time_format(snapshot.until_workday_done()),
+            time_format(
+                snapshot.week_total(), threshold=self.calendar.week_target(*self.current_week),
+            ),
+            time_format_absolute(snapshot.now, snapshot.when_leave()),
         )
 
-    def workday_status(self):
+    def load_weeks(self, since=None, last=None) -> None:
+        """
+        Load only the weeks from the ISO (year, week) since, and at most the
+        last number of weeks, reading the days file backwards. The flex of
+        the days before them comes from the checkpoint.
+        """
+        self.load_incremental()
+        current_day = self.current_day()
+        weeks = {current_day.iso_week}
+        records = []
+        for record in open_days_file(self.days_file).reversed_records():
+            key = record_week(record)
+            if since is not None and key < since:
+                break
+            if key not in weeks:
+                if last is not None and len(weeks) >= last:
+                    break
+                weeks.add(key)
+            records.append(record)
+        records.reverse()
+        self.all_days = DayLog(records, calendar=self.calendar)
+        self.earlier_flex = self.until_today - timedelta(
+            seconds=self.all_days.prefix[-1] + self.until_today_target - self.all_days.targets[-1]
+        )
+        self.all_days.append(self.current_record())
+
+    def iter_workday_status(self):
+        """Render workday_status() one week at a time"""
         week = None
         week_total = timedelta()
-        result = ''
-        week_summary_flex = timedelta()
-        for day in self.all_days:
-            if week != day.week:
-                result += total_format(week_total)
+        block = []
+        week_summary_flex = self.earlier_flex
+        snapshot = self.snapshot()
+        for index, day in enumerate(self.all_days.days_at(snapshot.now)):
+            if week != day.iso_week:
                 if week is not None:
-                    result += ' ({})\n'.format(time_format(week_summary_flex))
-                result += str(day.week) + '\n'
-                week = day.week
+                    block.append(total_format(week_total))
+                    block.append(' ({})\n'.format(time_format(week_summary_flex)))
+                    yield ''.join(block)
+                block = [str(day.week) + '\n']
+                week = day.iso_week
                 week_total = timedelta()
 
-            week_summary_flex += day.day_time() - timedelta(hours=WORKDAY_HOURS)
-            result += '  {} {}\n'.format(
-                day.day_name,
+            days = self.all_days.days(index, index + 1)
+            target = self.all_days.target(index, index + 1)
+            week_summary_flex += day.day_time() - timedelta(seconds=target)
+            block.append('  {} {}\n'.format(
+                f'{days} days' if index in self.all_days.summaries else day.day_name,
                 time_format(day.day_time()),
-            )
+            ))
             week_total += day.day_time()
-        result += total_format(week_total)
-        result += ' ({})\n'.format(time_format(week_summary_flex))
-        result += '\nDay started at: {}'.format(
-            time_format_absolute(self.current_day().start_day)
+        block.append(total_format(week_total))
+        block.append(' ({})\n'.format(time_format(week_summary_flex)))
+        yield ''.join(block)
+        yield '\nDay started at: {}'.format(
+            time_format_absolute(snapshot.current_day.start_day)
         )
-        result += '\nFlex (until today): {}'.format(
-            time_format(self.flex()),
+        yield '\nFlex (until today): {}'.format(
+            time_format(snapshot.flex()),
         )
-        result += '\nFlex (leave now): {}'.format(
-            time_format(datetime.now()-self.when_leave())
+        yield '\nFlex (leave now): {}'.format(
+            time_format(snapshot.now-snapshot.when_leave())
         )
-        result += '\nZero flex at: {}'.format(
-            time_format_absolute(self.when_leave())
+        yield '\nZero flex at: {}'.format(
+            time_format_absolute(snapshot.when_leave())
         )
-        result += '\nFull workday at: {}'.format(
-            time_format_absolute(self.full_workday())
+        yield '\nFull workday at: {}'.format(
+            time_format_absolute(snapshot.full_workday())
         )
-        return result
 
+    def workday_status(self):
+        return ''.join(self.iter_workday_status())
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+
+class Snapshot:
+    """
+    The status of a Workday at one moment. Now and the current day are
+    captured once, and each value is computed once, so the fields of a
+    render agree with each other even across a minute boundary.
+    """
+    def __init__(self, workday: Workday, now=None):
+        self.workday = workday
+        self.now = datetime.now() if now is None else now
+        self.current_day = Day(*workday.current_record(), now=self.now)
+        self._values = {}
+
+    def _memoised(self, name: str, compute):
+        if name not in self._values:
+            self._values[name] = compute()
+        return self._values[name]
+
+    def day_time(self) -> timedelta:
+        return self._memoised('day_time', self.current_day.day_time)
+
+    def day_target(self) -> int:
+        """Target seconds of the current day in the calendar"""
+        return self._memoised(
+            'day_target', lambda: self.workday.calendar.target(self.current_day.start_day.date()),
+        )
+
+    def until_workday_done(self) -> timedelta:
+        return timedelta(seconds=self.day_target()) - self.day_time()
+
+    def flex(self) -> timedelta:
+        return self._memoised('flex', self.workday.flex)
+
+    def week_total(self) -> timedelta:
+        return self._memoised('week_total', lambda: sum(
+            (day.day_time() for day in self.workday.week_days),
+            self.day_time(),
+        ))
+
+    def when_leave(self) -> datetime:
+        """When you can leave and have zero flex"""
+        return self.now + self.until_workday_done() - self.flex()
+
+    def full_workday(self) -> datetime:
+        """When you have a full workday"""
+        return self.now + self.until_workday_done()
+
+
+class Statistics:
+    """
+    Vectorised statistics over a days file, computed with NumPy, which is
+    an optional dependency (pip install workday[stats]). Every array has
+    one entry per logged day, except the per week, month and year totals.
+    Compacted weeks only count towards the totals, and towards months and
+    years by their Thursday. Flex is against the targets of calendar.
+    """
+    def __init__(self, days, calendar=DEFAULT_CALENDAR):
+        import numpy  # pylint: disable=import-outside-toplevel
+        rows = days.reshape(-1, 4)
+        summaries = rows[:, 0] == SUMMARY
+        _, compacted_weeks, compacted_seconds, compacted_days = rows[summaries].T
+        compacted_targets = numpy.array(
+            [calendar.record_target(record) for record in rows[summaries].tolist()],
+            dtype=numpy.int64,
+        )
+        self.compacted = (compacted_weeks, compacted_seconds, compacted_days, compacted_targets)
+        self.compacted_flex = int((compacted_seconds - compacted_targets).sum())
+        start_day, start_lunch, end_lunch, end_day = rows[~summaries].T
+        self.start_day = start_day
+        self.worked = end_day - start_day - (end_lunch - start_lunch)
+        self.lunch = end_lunch - start_lunch
+
+        # Local dates, with the UTC offset looked up once per distinct UTC
+        # date rather than once per day
+        utc_dates, inverse = numpy.unique(start_day // 86400, return_inverse=True)
+        offsets = numpy.array(
+            [datetime.fromtimestamp(date * 86400 + 43200).astimezone().utcoffset().total_seconds()
+             for date in utc_dates.tolist()],
+            dtype=numpy.int64,
+        )
+        local = start_day + offsets[inverse.reshape(-1)]
+        self.date = local // 86400
+        self.start_time = local - self.date * 86400
+
+        # Targets by weekday, 1970-01-01 being a Thursday, then the dates of
+        # the calendar looked up by bisection
+        if calendar.uniform is not None:
+            self.target = numpy.full(len(self.date), calendar.uniform, dtype=numpy.int64)
+        else:
+            self.target = numpy.array(calendar.weekdays, dtype=numpy.int64)[(self.date + 3) % 7]
+            if calendar.dates:
+                epoch = datetime(1970, 1, 1).date()
+                exceptions = sorted(
+                    ((day - epoch).days, seconds) for day, seconds in calendar.dates.items()
+                )
+                exception_dates, exception_targets = (
+                    numpy.array(column, dtype=numpy.int64) for column in zip(*exceptions)
+                )
+                found = numpy.searchsorted(exception_dates, self.date)
+                found = found.clip(max=len(exception_dates) - 1)
+                matches = exception_dates[found] == self.date
+                self.target[matches] = exception_targets[found[matches]]
+        self.flex = numpy.cumsum(self.worked - self.target) + self.compacted_flex
+
+        # ISO weeks belong to the year of their Thursday
+        thursday = self.date - (self.date + 3) % 7 + 3
+        years = thursday.astype('datetime64[D]').astype('datetime64[Y]')
+        january = years.astype('datetime64[D]').astype(numpy.int64)
+        self.iso_year = years.astype(numpy.int64) + 1970
+        self.iso_week = (thursday - january) // 7 + 1
+        dates = self.date.astype('datetime64[D]')
+
+        # The Thursday of a compacted week is three days after the Monday of
+        # the week of January 4th, plus the weeks since
+        january_4th = (compacted_weeks // 100 - 1970).astype('datetime64[Y]')
+        january_4th = january_4th.astype('datetime64[D]').astype(numpy.int64) + 3
+        compacted_dates = (
+            january_4th - (january_4th + 3) % 7 + 3 + (compacted_weeks % 100 - 1) * 7
+        ).astype('datetime64[D]')
+
+        self.weeks = self._totals(self.iso_year * 100 + self.iso_week, compacted_weeks)
+        self.months = self._totals(
+            dates.astype('datetime64[M]'), compacted_dates.astype('datetime64[M]'),
+        )
+        self.years = self._totals(
+            dates.astype('datetime64[Y]'), compacted_dates.astype('datetime64[Y]'),
+        )
+
+    def _totals(self, keys, compacted_keys) -> tuple:
+        """Distinct keys, in order, with the worked seconds, days and target seconds of each"""
+        import numpy  # pylint: disable=import-outside-toplevel
+        _, compacted_seconds, compacted_days, compacted_targets = self.compacted
+        keys, inverse = numpy.unique(numpy.concatenate([keys, compacted_keys]), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        seconds = numpy.bincount(
+            inverse,
+            weights=numpy.concatenate([self.worked, compacted_seconds]),
+            minlength=len(keys),
+        )
+        counts = numpy.bincount(
+            inverse,
+            weights=numpy.concatenate([numpy.ones(len(self.worked)), compacted_days]),
+            minlength=len(keys),
+        )
+        targets = numpy.bincount(
+            inverse,
+            weights=numpy.concatenate([self.target, compacted_targets]),
+            minlength=len(keys),
+        )
+        return (
+            keys,
+            seconds.astype(numpy.int64),
+            counts.astype(numpy.int64),
+            targets.astype(numpy.int64),
+        )
+
+    @classmethod
+    def from_file(cls, path: str, calendar=DEFAULT_CALENDAR) -> 'Statistics':
+        import numpy  # pylint: disable=import-outside-toplevel
+        days = open_days_file(path)
+        if isinstance(days, BinaryDaysFile):
+            data = numpy.fromfile(path, dtype='<i8', offset=len(days.header))
+            return cls(data[:len(data) - len(data) % 4], calendar)
+        times = days.times()
+        warn_malformed(days)
+        if not times:
+            return cls(numpy.zeros(0, dtype=numpy.int64), calendar)
+        return cls(numpy.frombuffer(times, dtype=numpy.int64), calendar)
+
+    def report(self, periods=8) -> str:
+        """Summary of the totals, the last periods weeks and months and the distributions"""
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        def hours(seconds):
+            return time_format(timedelta(seconds=int(seconds)))
+
+        def spread(values):
+            low, median, high = numpy.percentile(values, [10, 50, 90])
+            return f'{hours(median)} (10-90%: {hours(low)}-{hours(high)})'
+
+        _, compacted_seconds, compacted_days, _ = self.compacted
+        days = len(self.worked) + int(compacted_days.sum())
+        if days == 0:
+            return 'No days logged'
+        worked = int(self.worked.sum() + compacted_seconds.sum())
+        lines = [
+            'Days: {}'.format(days),
+            'Worked: {}, {} per day'.format(hours(worked), hours(worked / days)),
+        ]
+        if len(self.worked) == 0:
+            lines.append('Flex: {}'.format(hours(self.compacted_flex)))
+        else:
+            lines += [
+                'Flex: {} (lowest {}, highest {})'.format(
+                    hours(self.flex[-1]), hours(self.flex.min()), hours(self.flex.max()),
+                ),
+                'Start of day: {}'.format(spread(self.start_time)),
+                'Lunch: {}'.format(spread(self.lunch)),
+            ]
+        for title, (keys, seconds, counts, targets), label in (
+                ('Years', self.years, lambda key: f'{key.year}'),
+                ('Months', self.months, lambda key: f'{key.year}-{key.month:02}'),
+                ('Weeks', self.weeks, lambda key: f'{key // 100}-{key % 100:02}'),
+        ):
+            lines.append(f'{title}:')
+            rows = zip(keys.tolist(), seconds.tolist(), counts.tolist(), targets.tolist())
+            for key, total, count, target in list(rows)[-periods:]:
+                flex = total - target
+                lines.append(f'  {label(key)} {hours(total)} ({count} days, {hours(flex)})')
+        return '\n'.join(lines)
+
+
+def team_row(configfile: str) -> tuple:
+    """Name, flex, week total and zero flex time of one team member's config"""
+    name = os.path.splitext(os.path.basename(configfile))[0]
+    try:
+        workday = Workday(configfile=configfile)
+        workday.load_incremental(read_only=True)
+        return (
+            workday.config.get('name', name),
+            time_format(workday.flex()),
+            time_format(workday.week_total()),
+            time_format_absolute(workday.when_leave()),
+        )
+    except Exception as error:  # pylint: disable=broad-except
+        return (name, 'error', str(error), '')
+
+
+def team_configs(patterns) -> list:
+    """Config files matched by glob patterns, or the *.yaml files of directories"""
+    import glob  # pylint: disable=import-outside-toplevel
+    configs = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.yaml')
+        configs.update(glob.glob(pattern))
+    return sorted(configs)
+
+
+def team_report(patterns, workers=None) -> str:
+    """
+    Table of the flex, week total and zero flex time of every config file
+    matched by patterns, loaded in parallel in a process pool.
+    """
+    configs = team_configs(patterns)
+    if len(configs) < 2 or workers == 1:
+        rows = [team_row(configfile) for configfile in configs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(team_row, configs, chunksize=max(1, len(configs) // 64)))
+    rows.insert(0, ('Name', 'Flex', 'Week', 'Zero flex'))
+    widths = [max(len(row[column]) for row in rows) for column in range(4)]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+def export_rows(days: TextDaysFile, start=None, end=None, calendar=DEFAULT_CALENDAR):
+    """
+    Rows of EXPORT_FIELDS of the days starting on the dates from start up to
+    and including end, each week followed by a row of its totals and flex
+    against calendar. Days are read a chunk at a time, and compacted weeks
+    only give their totals.
+    """
+    low = high = None
+    if start is not None:
+        low = int(datetime(start.year, start.month, start.day).timestamp())
+    if end is not None:
+        high = int((datetime(end.year, end.month, end.day) + timedelta(days=1)).timestamp())
+    week = None
+    worked = count = target = 0
+    for record in chain.from_iterable(as_records(times) for times in days.chunks()):
+        key = record_week(record)
+        started = record_start(record)
+        if low is not None and started < low:
+            continue
+        if high is not None and started >= high:
+            break
+        if key != week:
+            if week is not None:
+                yield week_row(week, worked, count, target)
+            week = key
+            worked = count = target = 0
+        seconds, days_count = record_totals(record)
+        worked += seconds
+        count += days_count
+        target += calendar.record_target(record)
+        if record[0] != SUMMARY:
+            yield ('day', *key, *record, seconds, record[2] - record[1], None, None)
+    warn_malformed(days)
+    if week is not None:
+        yield week_row(week, worked, count, target)
+
+
+def week_row(week: tuple, worked: int, days: int, target: int) -> tuple:
+    return ('week', *week, None, None, None, None, worked, None, days, worked - target)
+
+
+def export(
+        days: TextDaysFile, out, export_format: str, start=None, end=None, rows_per_write=4096,
+        calendar=DEFAULT_CALENDAR,
+) -> None:
+    """
+    Write the export_rows() of days to out as csv, a json array or json
+    lines, with one write per rows_per_write rows
+    """
+    rows = export_rows(days, start, end, calendar)
+    chunks = iter(lambda: list(islice(rows, rows_per_write)), [])
+    if export_format == 'csv':
+        import csv  # pylint: disable=import-outside-toplevel
+        import io  # pylint: disable=import-outside-toplevel
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(EXPORT_FIELDS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            out.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+        out.write(buffer.getvalue())
+        return
+    import json  # pylint: disable=import-outside-toplevel
+    written = False
+    for chunk in chunks:
+        lines = [
+            json.dumps({
+                field: value for field, value in zip(EXPORT_FIELDS, row) if value is not None
+            })
+            for row in chunk
+        ]
+        if export_format == 'ndjson':
+            out.write('\n'.join(lines) + '\n')
+        else:
+            out.write((',\n' if written else '[\n') + ',\n'.join(lines))
+        written = True
+    if export_format == 'json':
+        out.write('\n]\n' if written else '[]\n')
+
+
+def parse_punch(text: str):
+    """The epoch of an ISO 8601 date and time, or None if text isn't one"""
+    try:
+        return int(datetime.fromisoformat(text.strip()).timestamp())
+    except ValueError:
+        return None
+
+
+def parse_punches(lines: list, delimiter: str) -> list:
+    """
+    The epochs of the punches on lines of a time clock export. The punch of
+    a row is its first date and time cell, or date cell followed by a time
+    cell. Rows without one, like headers, are skipped.
+    """
+    import csv  # pylint: disable=import-outside-toplevel
+    punches = []
+    for row in csv.reader(lines, delimiter=delimiter):
+        for index, cell in enumerate(row):
+            punch = None
+            if index + 1 < len(row):
+                punch = parse_punch(f'{cell.strip()} {row[index + 1].strip()}')
+            if punch is None and ':' in cell:
+                punch = parse_punch(cell)
+            if punch is not None:
+                punches.append(punch)
+                break
+    return punches
+
+
+def pair_punches(punches) -> tuple:
+    """
+    Day records of punches, grouped by local date. The first and last punch
+    of a date start and end the day, and the breaks between the pairs of
+    punches in between add up to its lunch, which starts at the end of the
+    first pair. Returns the records and the dates with an odd number of
+    punches, which are left out.
+    """
+    dates = {}
+    for punch in sorted(set(punches)):
+        dates.setdefault(datetime.fromtimestamp(punch).date(), []).append(punch)
+    records = []
+    unpaired = []
+    for date, times in dates.items():
+        if len(times) % 2:
+            unpaired.append(date)
+            continue
+        breaks = sum(times[index + 1] - times[index] for index in range(1, len(times) - 1, 2))
+        records.append((times[0], times[1], times[1] + breaks, times[-1]))
+    return records, unpaired
+
+
+def parse_date(date: str) -> datetime:
+    return datetime.strptime(date, '%Y-%m-%d')
+
+
+def parse_week(week: str) -> tuple:
+    """Parse an ISO week on the form YYYY-WW into (year, week)"""
+    year, number = (int(part) for part in week.split('-'))
+    if not 1 <= number <= 53:
+        raise ValueError(f'No such week: {week}')
+    return year, number
+
+
+def unix_sockets() -> bool:
+    """Whether the daemon can run here, it needs unix sockets and user ids"""
+    import socket  # pylint: disable=import-outside-toplevel
+    return hasattr(socket, 'AF_UNIX') and hasattr(os, 'getuid')
+
+
+def default_socket() -> str:
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(runtime, f'workday-{os.getuid()}.sock')
+
+
+class ResidentWorkday:
+    """A loaded Workday that is reloaded when any of its source files change"""
+    def __init__(self, configfile: str):
+        self.configfile = configfile
+        self.workday = None
+        self.key = None
+
+    def get(self) -> Workday:
+        week = tuple(datetime.now().isocalendar()[:2])
+        if self.workday is not None:
+            key = (week, stat_key(self.workday.source_files()))
+            if key == self.key:
+                return self.workday
+        workday = Workday(configfile=self.configfile, current_week=week)
+        # Stat before loading, so that changes made during the load trigger another
+        self.key = (week, stat_key(workday.source_files()))
+        workday.load()
+        self.workday = workday
+        return workday
+
+
+class DaemonServer:
+    """
+    Unix socket server keeping one config file loaded between queries. Each
+    connection sends one line, "<command> <config file>", and gets "ok" or
+    "error" on the first line of the reply and the result or reason after.
+    """
+    poll_interval = 0.5
+
+    def __init__(self, configfile: str, path=None):
+        import socket  # pylint: disable=import-outside-toplevel
+        self.path = default_socket() if path is None else path
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                try:
+                    client.connect(self.path)
+                except OSError:
+                    os.remove(self.path)
+                else:
+                    raise RuntimeError(f'A daemon is already listening on {self.path}')
+        self.resident = ResidentWorkday(os.path.abspath(configfile))
+        self.running = False
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            self.socket.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.socket.listen()
+        self.socket.settimeout(self.poll_interval)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.socket.close()
+        os.remove(self.path)
+
+    def serve_forever(self) -> None:
+        import socket  # pylint: disable=import-outside-toplevel
+        self.running = True
+        while self.running:
+            try:
+                connection, _ = self.socket.accept()
+            except socket.timeout:
+                continue
+            with connection:
+                connection.settimeout(self.poll_interval)
+                try:
+                    with connection.makefile('rb') as request:
+                        line = request.readline()
+                    connection.sendall(self.handle(line.decode()))
+                except OSError:
+                    pass
+
+    def shutdown(self) -> None:
+        """Stop serve_forever(), from another thread or a signal handler"""
+        self.running = False
+
+    def handle(self, line: str) -> bytes:
+        command, _, configfile = line.strip().partition(' ')
+        try:
+            if os.path.abspath(configfile) != self.resident.configfile:
+                raise ValueError(f'Serving another config file than {configfile}')
+            workday = self.resident.get()
+            if command == 'tmux':
+                reply = workday.tmux_status()
+            elif command == 'weeks':
+                reply = workday.workday_status()
+            else:
+                raise ValueError(f'Unknown command: {command}')
+            return b'ok\n' + reply.encode()
+        except Exception as error:  # pylint: disable=broad-except
+            return f'error\n{error}'.encode()
+
+
+def serve(configfile: str, path=None) -> None:
+    """Answer tmux and weeks queries for configfile until interrupted"""
+    with DaemonServer(configfile, path) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def query_daemon(command: str, configfile: str, path=None, timeout=1.0):
+    """Return the daemon's reply to command, or None if no daemon could answer"""
+    if not hasattr(os, 'getuid'):
+        return None
+    path = default_socket() if path is None else path
+    try:
+        owner = os.stat(path).st_uid
+    except OSError:
+        return None
+    # Without XDG_RUNTIME_DIR the socket is in /tmp, where another user could have made it
+    if owner != os.getuid():
+        return None
+    import socket  # pylint: disable=import-outside-toplevel
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    chunks = []
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(path)
+            client.sendall(f'{command} {os.path.abspath(configfile)}\n'.encode())
+            chunk = client.recv(65536)
+            while chunk:
+                chunks.append(chunk)
+                chunk = client.recv(65536)
+    except OSError:
+        return None
+    status, _, reply = b''.join(chunks).decode().partition('\n')
+    return reply if status == 'ok' else None
+
+
+def current_minute() -> int:
+    return int(datetime.now().timestamp()) // 60
+
+
+def render_cache_file(configfile: str) -> str:
+    return f'{configfile}.tmux'
+
+
+def read_render_cache(configfile: str):
+    """
+    Return the tmux status rendered earlier this minute, if none of the files
+    it was rendered from have changed since, otherwise None.
+    """
+    try:
+        with open(render_cache_file(configfile)) as file:
+            minute, *sources, status = file.read().split('\n')
+    except (OSError, ValueError):
+        return None
+    if minute != str(current_minute()):
+        return None
+    paths = [source.split(' ', 1)[1] for source in sources]
+    if render_cache_sources(paths) != sources:
+        return None
+    return status
+
+
+def render_cache_sources(paths) -> list:
+    return [
+        '{} {}'.format('-' if key is None else '-'.join(str(part) for part in key), path)
+        for key, path in zip(stat_key(paths), paths)
+    ]
+
+
+def write_render_cache(configfile: str, minute: int, sources: list, status: str) -> None:
+    with replacing(render_cache_file(configfile)) as temporary:
+        with open(temporary, 'w') as file:
+            file.write('\n'.join([str(minute), *sources, status]))
+
+
+def tmux(configfile: str, socket_path=None) -> str:
+    """
+    The tmux status. It only shows hours and minutes, so it is rendered at
+    most once a minute, unless the config or days file changes, and then
+    read from a cache next to the config file. A running daemon is asked
+    before rendering it here.
+    """
+    with PROFILER.phase('cache'):
+        reply = read_render_cache(configfile)
+    if reply is None:
+        with PROFILER.phase('daemon'):
+            reply = query_daemon('tmux', configfile, socket_path)
+    if reply is None:
+        minute = current_minute()
+        workday = Workday(configfile=configfile)
+        # Stat before loading, so that changes made during the load aren't cached
+        paths = workday.source_files()
+        sources = render_cache_sources(paths)
+        workday.load_incremental()
+        with PROFILER.phase('format'):
+            reply = workday.tmux_status()
+        if render_cache_sources(paths) == sources:
+            try:
+                write_render_cache(configfile, minute, sources, reply)
+            except OSError:
+                pass
+    return reply
+
+
+class FileWatcher:
+    """
+    Waits for changes to files, with inotify where libc has it and by
+    polling their stat information otherwise. Their directories are watched,
+    so files replaced by a rename are followed.
+    """
+    poll_interval = 1.0
+    # IN_MODIFY, IN_ATTRIB, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE and IN_DELETE
+    mask = 0x2 | 0x4 | 0x40 | 0x80 | 0x100 | 0x200
+    event = struct.Struct('iIII')
+
+    def __init__(self, paths, inotify=True):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.key = stat_key(self.paths)
+        self.fd = None
+        self.watched = set()
+        if inotify:
+            self._add_watches()
+
+    def _add_watches(self) -> None:
+        import ctypes  # pylint: disable=import-outside-toplevel
+        import ctypes.util  # pylint: disable=import-outside-toplevel
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            inotify_init1, inotify_add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return
+        fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return
+        directories = {}
+        for path in self.paths:
+            directory, name = os.path.split(path)
+            if directory not in directories:
+                directories[directory] = inotify_add_watch(fd, os.fsencode(directory), self.mask)
+                if directories[directory] < 0:
+                    os.close(fd)
+                    self.watched = set()
+                    return
+            self.watched.add((directories[directory], os.fsencode(name)))
+        self.fd = fd
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def wait(self, timeout: float) -> bool:
+        """Wait at most timeout seconds for a change, and return whether one came"""
+        if self.fd is None:
+            return self._poll(timeout)
+        import select  # pylint: disable=import-outside-toplevel
+        deadline = monotonic() + timeout
+        while True:
+            readable, _, _ = select.select([self.fd], [], [], max(deadline - monotonic(), 0))
+            if not readable:
+                return False
+            if self._changed(os.read(self.fd, 65536)):
+                self.key = stat_key(self.paths)
+                return True
+
+    def _changed(self, data: bytes) -> bool:
+        """Whether the inotify events in data are about any of the files"""
+        offset = 0
+        changed = False
+        while offset < len(data):
+            wd, _, _, length = self.event.unpack_from(data, offset)
+            offset += self.event.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            changed = changed or (wd, name) in self.watched
+        return changed
+
+    def _poll(self, timeout: float) -> bool:
+        while timeout > 0:
+            sleep(min(self.poll_interval, timeout))
+            timeout -= self.poll_interval
+            key = stat_key(self.paths)
+            if key != self.key:
+                self.key = key
+                return True
+        return False
+
+
+def watch(configfile: str, out=None, updates=None, inotify=True) -> None:
+    """
+    Write the tmux status to out, by default stdout, when the minute changes
+    and when the config or days file changes, sleeping in between. The data
+    is kept loaded. Returns after updates lines, or runs until interrupted.
+    """
+    out = sys.stdout if out is None else out
+    resident = ResidentWorkday(configfile)
+    watcher = None
+    try:
+        while updates is None or updates > 0:
+            workday = resident.get()
+            paths = [os.path.abspath(path) for path in workday.source_files()]
+            if watcher is None or watcher.paths != paths:
+                if watcher is not None:
+                    watcher.close()
+                watcher = FileWatcher(paths, inotify)
+            out.write(workday.tmux_status() + '\n')
+            out.flush()
+            if updates is not None:
+                updates -= 1
+                if updates == 0:
+                    break
+            # Wake just past the next minute boundary, unless a file changes first
+            minute = current_minute()
+            while current_minute() == minute:
+                if watcher.wait(60 - datetime.now().timestamp() % 60 + 0.01):
+                    break
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def start_empty_day(workday: Workday) -> None:
+    if workday.config.get('start_day', 0) == 0:
+        workday.set_config('start_day', int(datetime.now().timestamp()))
+
+
+def fast_main(argv: list) -> bool:
+    """
+    Run the commands used on every status line refresh and screen unlock
+    without importing argparse or building the parser. Returns False, doing
+    nothing, for any other command line.
+    """
+    configfile = None
+    commands = []
+    arguments = iter(argv)
+    for argument in arguments:
+        if argument in ('--config', '-c'):
+            configfile = next(arguments, '-')
+            if configfile.startswith('-'):
+                return False
+        elif argument in HOT_COMMANDS:
+            commands.append(HOT_COMMANDS[argument])
+        else:
+            return False
+    if len(commands) != 1:
+        return False
+    configfile = default_config_file() if configfile is None else configfile
+    if commands[0] == 'tmux':
+        print(tmux(configfile))
+    else:
+        start_empty_day(Workday(configfile=configfile))
+    return True
+
+
+def build_parser():
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    class InOrder(argparse.Action):
+        """Store like store or store_true, and add the action and its value to actions"""
+        def __call__(self, parser, namespace, values, option_string=None):
+            value = self.const if self.nargs == 0 else values
+            setattr(namespace, self.dest, value)
+            # A new list, as the default one is shared by every parse
+            namespace.actions = [*namespace.actions, (self.dest, value)]
+
+    parser = argparse.ArgumentParser(
+        epilog=(
+            'Actions run in the order they are given, '
+            'and config changes are written once at the end'
+        ),
+    )
+    parser.set_defaults(actions=[])
     parser.add_argument(
         '--config',
         '-c',
@@ -249,7 +2285,7 @@ if __name__ == '__main__':
     parser.add_argument(
         '--start-day',
         help='start day at HH:MM, defaults to current time',
-        action='store',
+        action=InOrder,
         metavar='HH:MM',
         nargs='?',
         const=time_format_absolute(datetime.now()),
@@ -257,7 +2293,7 @@ if __name__ == '__main__':
     parser.add_argument(
         '--start-empty-day',
         help='start day at HH:MM if no start date has been set, defaults to current time',
-        action='store',
+        action=InOrder,
         metavar='HH:MM',
         nargs='?',
         const=time_format_absolute(datetime.now()),
@@ -265,7 +2301,7 @@ if __name__ == '__main__':
     parser.add_argument(
         '--end-day',
         help='end day at HH:MM, defaults to current time',
-        action='store',
+        action=InOrder,
         metavar='HH:MM',
         nargs='?',
         const=time_format_absolute(datetime.now()),
@@ -273,41 +2309,321 @@ if __name__ == '__main__':
     parser.add_argument(
         '--lunch',
         help='lunch occured between HH:MM and HH:MM',
-        action='store',
+        action=InOrder,
         metavar='HH:MM',
         nargs=2,
     )
-    parser.add_argument('--log-day', '-l', help='add day to persistent log', action='store_true')
-    parser.add_argument('--reset', '-r', help='reset data for today', action='store_true')
-    parser.add_argument('--reset-end', help='reset data for end of day', action='store_true')
-    parser.add_argument('--tmux', '-t', help='print tmux format', action='store_true')
-    parser.add_argument('--weeks', '-w', help='print weeks status', action='store_true')
-    parser.add_argument('--version', '-v', help='print version', action='store_true')
-    args = parser.parse_args()
-    workday = Workday(configfile=args.config)
-    if args.reset:
+    parser.add_argument(
+        '--log-day',
+        '-l',
+        help='add day to persistent log',
+        action=InOrder,
+        nargs=0,
+        const=True,
+        default=False,
+    )
+    parser.add_argument(
+        '--reset',
+        '-r',
+        help='reset data for today',
+        action=InOrder,
+        nargs=0,
+        const=True,
+        default=False,
+    )
+    parser.add_argument(
+        '--reset-end',
+        help='reset data for end of day',
+        action=InOrder,
+        nargs=0,
+        const=True,
+        default=False,
+    )
+    parser.add_argument(
+        '--tmux',
+        '-t',
+        help='print tmux format',
+        action=InOrder,
+        nargs=0,
+        const=True,
+        default=False,
+    )
+    parser.add_argument(
+        '--weeks',
+        '-w',
+        help='print weeks status',
+        action=InOrder,
+        nargs=0,
+        const=True,
+        default=False,
+    )
+    parser.add_argument(
+        '--since',
+        help='only show weeks from this ISO week with --weeks',
+        action='store',
+        metavar='YYYY-WW',
+        type=parse_week,
+    )
+    parser.add_argument(
+        '--last',
+        help='only show the last N weeks with --weeks',
+        action='store',
+        metavar='N',
+        type=int,
+    )
+    parser.add_argument(
+        '--flex-between',
+        help='print the flex of the days logged between two dates',
+        action=InOrder,
+        metavar='YYYY-MM-DD',
+        nargs=2,
+        type=parse_date,
+    )
+    parser.add_argument(
+        '--stats',
+        help='print statistics over all logged days, needs numpy',
+        action=InOrder,
+        nargs=0,
+        const=True,
+        default=False,
+    )
+    parser.add_argument(
+        '--batch',
+        help='also run the actions read from stdin, one per line, like "end-day 17:00"',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--export',
+        help='print the logged days and week totals from the days file',
+        action=InOrder,
+        choices=EXPORT_FORMATS,
+    )
+    parser.add_argument(
+        '--from',
+        help='only export the days from this date',
+        action='store',
+        metavar='YYYY-MM-DD',
+        type=parse_date,
+        dest='start',
+    )
+    parser.add_argument(
+        '--to',
+        help='only export the days until and including this date',
+        action='store',
+        metavar='YYYY-MM-DD',
+        type=parse_date,
+        dest='end',
+    )
+    parser.add_argument(
+        '--import',
+        help='add the days of a CSV or TSV time clock export of punches to the days file',
+        action=InOrder,
+        metavar='FILE',
+        dest='import_file',
+    )
+    parser.add_argument(
+        '--team',
+        help='print flex and week totals of every config in directories or globs',
+        action='store',
+        metavar='PATH',
+        nargs='+',
+    )
+    parser.add_argument(
+        '--convert',
+        help='convert the days file to the given format',
+        action=InOrder,
+        choices=list(DAYS_FORMATS),
+    )
+    parser.add_argument(
+        '--daemon',
+        help='keep the data loaded and answer --tmux and --weeks from a unix socket',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--watch',
+        help='keep the data loaded and print the tmux status every minute and on changes',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--socket',
+        help='location of the daemon socket',
+        action='store',
+        default=None,
+    )
+    parser.add_argument(
+        '--compact',
+        help='roll the days of weeks older than WEEKS, by default 52, into weekly totals',
+        action=InOrder,
+        metavar='WEEKS',
+        nargs='?',
+        type=int,
+        const=True,
+    )
+    parser.add_argument(
+        '--profile',
+        help='print the time spent in each phase to stderr, or append it to FILE as json',
+        action='store',
+        metavar='FILE',
+        nargs='?',
+    )
+    parser.add_argument(
+        '--profile-dump',
+        help='store cProfile statistics of the run in FILE',
+        action='store',
+        metavar='FILE',
+    )
+    parser.add_argument(
+        '--version', '-v', help='print version', action=InOrder, nargs=0, const=True, default=False,
+    )
+    return parser
+
+
+def batch_arguments(lines) -> list:
+    """Command line arguments of lines of actions, given with or without their --"""
+    import shlex  # pylint: disable=import-outside-toplevel
+    arguments = []
+    for line in lines:
+        words = shlex.split(line, comments=True)
+        if words and not words[0].startswith('-'):
+            words[0] = f'--{words[0]}'
+        arguments += words
+    return arguments
+
+
+def main(argv=None) -> None:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    argv = PROFILER.configure(argv, os.environ)
+    try:
+        if PROFILER.dump is None:
+            run(argv)
+        else:
+            import cProfile  # pylint: disable=import-outside-toplevel
+            profile = cProfile.Profile()
+            try:
+                profile.runcall(run, argv)
+            finally:
+                profile.dump_stats(PROFILER.dump)
+    finally:
+        PROFILER.emit(argv)
+
+
+def run(argv: list) -> None:
+    if fast_main(argv):
+        return
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.batch:
+        args = parser.parse_args(argv + batch_arguments(sys.stdin))
+    configfile = default_config_file() if args.config is None else args.config
+    modes = [option for option, given in (
+        ('--daemon', args.daemon), ('--watch', args.watch), ('--team', args.team is not None),
+    ) if given]
+    if len(modes) > 1 or (modes and args.actions):
+        parser.error(f'{modes[0]} can not be combined with other actions')
+    reply = None
+    if args.actions == [('tmux', True)]:
+        reply = tmux(configfile, args.socket)
+    elif args.actions == [('weeks', True)] and args.since is None and args.last is None:
+        reply = query_daemon('weeks', configfile, args.socket)
+    if reply is not None:
+        print(reply)
+        return
+    if args.daemon:
+        if not unix_sockets():
+            parser.error('--daemon needs unix sockets, which this platform lacks')
+        serve(configfile, args.socket)
+        return
+    if args.watch:
+        try:
+            watch(configfile)
+        except (KeyboardInterrupt, BrokenPipeError):
+            pass
+        return
+    if args.team is not None:
+        print(team_report(args.team))
+        return
+    if not args.actions:
+        parser.print_help()
+        return
+    workday = Workday(configfile=configfile)
+    with workday.batch_config():
+        for action, value in args.actions:
+            run_action(workday, parser, args, action, value)
+
+
+def run_action(workday: Workday, parser, args, action: str, value) -> None:
+    """Run one action of the command line with its value"""
+    if action == 'reset':
         workday.reset()
-    elif args.reset_end:
+    elif action == 'reset_end':
         workday.set_config('end_day', 0)
-    elif args.start_day is not None:
-        workday.set_config('start_day', timestamp_from_string(args.start_day))
-    elif args.start_empty_day is not None:
-        if workday.config.get('start_day', 0) == 0:
-            workday.set_config('start_day', int(datetime.now().timestamp()))
-    elif args.end_day is not None:
-        workday.set_config('end_day', timestamp_from_string(args.end_day))
-    elif args.lunch is not None:
-        workday.set_config('start_lunch', timestamp_from_string(args.lunch[0]))
-        workday.set_config('end_lunch', timestamp_from_string(args.lunch[1]))
-    elif args.log_day:
+    elif action == 'start_day':
+        workday.set_config('start_day', timestamp_from_string(value))
+    elif action == 'start_empty_day':
+        start_empty_day(workday)
+    elif action == 'end_day':
+        workday.set_config('end_day', timestamp_from_string(value))
+    elif action == 'lunch':
+        workday.set_config_many({
+            'start_lunch': timestamp_from_string(value[0]),
+            'end_lunch': timestamp_from_string(value[1]),
+        })
+    elif action == 'log_day':
         workday.log_day()
-    elif args.tmux:
-        workday.load()
-        print(workday.tmux_status())
-    elif args.weeks:
+    elif action == 'tmux':
+        workday.load_incremental()
+        with PROFILER.phase('format'):
+            print(workday.tmux_status())
+    elif action == 'weeks':
+        if args.since is None and args.last is None:
+            workday.load()
+        else:
+            workday.load_weeks(since=args.since, last=args.last)
+        with PROFILER.phase('format'):
+            for chunk in workday.iter_workday_status():
+                sys.stdout.write(chunk)
+            sys.stdout.write('\n')
+    elif action == 'flex_between':
         workday.load()
-        print(workday.workday_status())
-    elif args.version:
+        print(time_format(workday.flex_between(*value)))
+    elif action == 'stats':
+        try:
+            statistics = Statistics.from_file(workday.days_file, workday.calendar)
+        except ImportError:
+            parser.error('--stats needs numpy, install it with pip install workday[stats]')
+        print(statistics.report())
+    elif action == 'export':
+        export(
+            open_days_file(workday.days_file), sys.stdout, value, args.start, args.end,
+            calendar=workday.calendar,
+        )
+    elif action == 'import_file':
+        try:
+            added, skipped, unpaired = workday.import_punches(value)
+        except ValueError as error:
+            parser.error(str(error))
+        print(f'Imported {added} days, skipped {len(skipped)} already logged days')
+        if unpaired:
+            print('Left out the days with an odd number of punches: {}'.format(
+                ', '.join(str(date) for date in unpaired)
+            ))
+    elif action == 'convert':
+        try:
+            convert_days_file(workday.days_file, workday.days_file, days_format=value)
+        except ValueError as error:
+            parser.error(str(error))
+    elif action == 'compact':
+        try:
+            days, weeks = workday.compact(None if value is True else value)
+        except ValueError as error:
+            parser.error(str(error))
+        print(f'Compacted {days} days into {weeks} weeks')
+    elif action == 'version':
         print(__version__)
-    else:
-        parser.print_help()
+
+
+IMPORT_TIME = (perf_counter() - IMPORT_STARTED[0], sys.getallocatedblocks() - IMPORT_STARTED[1])
+
+
+if __name__ == '__main__':
+    main()